@@ -1,20 +1,14 @@
 import os
+import sys
 from dotenv import load_dotenv
-import requests
-import json
-import uuid
 
 
 load_dotenv("./src/api/.env")
+sys.path.insert(0, "./src")
+
+from api.loader import insert_rows
 
 
-CONTENT_TYPE = "application/json"
-API_KEY = "TBD"
-VALID_HEADERS = {"Content-Type": CONTENT_TYPE, "x-api-key": API_KEY}
-APPLICATION_URL = os.getenv("APPLICATION_URL")
-USER_ROLES_URL = APPLICATION_URL + "/users/roles"
-USERS_URL = APPLICATION_URL + "/users"
-EVENTS_URL = APPLICATION_URL + "/events"
 USER_ROLE_UUID = os.getenv("USER_ROLE_UUID")
 ADMIN_ROLE_UUID = os.getenv("ADMIN_ROLE_UUID")
 COORDINATOR_ROLE_UUID = os.getenv("COORDINATOR_ROLE_UUID")
@@ -31,29 +25,13 @@ def load_user_roles():
     while not using cookies.
 
     """
-
-    # Create Admin
-    requests.post(
-        USER_ROLES_URL,
-        json={"id": ADMIN_ROLE_UUID, "role_name": "Admin"},
-        headers=VALID_HEADERS,
-        verify=False,
-    )
-
-    # Create Coordinator
-    requests.post(
-        USER_ROLES_URL,
-        json={"id": COORDINATOR_ROLE_UUID, "role_name": "Event Coordinator"},
-        headers=VALID_HEADERS,
-        verify=False,
-    )
-
-    # Create Users
-    requests.post(
-        USER_ROLES_URL,
-        json={"id": USER_ROLE_UUID, "role_name": "User"},
-        headers=VALID_HEADERS,
-        verify=False,
+    insert_rows(
+        "roles",
+        [
+            {"id": ADMIN_ROLE_UUID, "role_name": "Admin"},
+            {"id": COORDINATOR_ROLE_UUID, "role_name": "Event Coordinator"},
+            {"id": USER_ROLE_UUID, "role_name": "User"},
+        ],
     )
 
 
@@ -63,29 +41,20 @@ def load_default_users():
     This also creates a coordinator user for testing purposes.
 
     """
-
-    # Create Admin
-    requests.post(
-        USERS_URL,
-        json={
-            "username": ADMIN_USERNAME,
-            "password": ADMIN_PASSWORD,
-            "user_role_id": ADMIN_ROLE_UUID,
-        },
-        headers=VALID_HEADERS,
-        verify=False,
-    )
-
-    # Create Coordinator
-    requests.post(
-        USERS_URL,
-        json={
-            "username": COORDINATOR_USERNAME,
-            "password": COORDINATOR_PASSWORD,
-            "user_role_id": COORDINATOR_ROLE_UUID,
-        },
-        headers=VALID_HEADERS,
-        verify=False,
+    insert_rows(
+        "users",
+        [
+            {
+                "username": ADMIN_USERNAME,
+                "password": ADMIN_PASSWORD,
+                "user_role_id": ADMIN_ROLE_UUID,
+            },
+            {
+                "username": COORDINATOR_USERNAME,
+                "password": COORDINATOR_PASSWORD,
+                "user_role_id": COORDINATOR_ROLE_UUID,
+            },
+        ],
     )
 
 
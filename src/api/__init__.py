@@ -16,16 +16,37 @@ ADMIN_ROLE_UUID = os.getenv("ADMIN_ROLE_UUID")
 COORDINATOR_ROLE_UUID = os.getenv("COORDINATOR_ROLE_UUID")
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+METRICS_DIRECTORY = os.getenv("METRICS_DIRECTORY")
+QUERY_PROFILE = os.getenv("QUERY_PROFILE")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+REPEATED_QUERY_LIMIT = int(os.getenv("REPEATED_QUERY_LIMIT", "3"))
+PROFILE_DIRECTORY = os.getenv("PROFILE_DIRECTORY")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "pstats")
+TOKEN_SECRET = os.getenv("TOKEN_SECRET")
+TOKEN_TTL = int(os.getenv("TOKEN_TTL", "3600"))
+TOKEN_REQUIRED = os.getenv("TOKEN_REQUIRED", "").lower() in ("1", "true")
+BROKER_DIRECTORY = os.getenv("BROKER_DIRECTORY")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "1"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+GROUP_COMMIT_MS = float(os.getenv("GROUP_COMMIT_MS", "0"))
+GROUP_COMMIT_SIZE = int(os.getenv("GROUP_COMMIT_SIZE", "100"))
+GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", "30"))
 
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = secrets.token_urlsafe()
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///data/data.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={"expire_on_commit": False})
 ma = Marshmallow(app)
 CORS(app)
 
 
 from api import routes
 from api import models
+from api import profiler
+from api import cpu_profiler
+from api import compression
@@ -0,0 +1,234 @@
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from api import db
+
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_RETENTION_DAYS = 365
+VACUUM_PAGES = 1000
+ANALYSIS_LIMIT = 1000
+
+# The rows of each table to archive, in the order the tables are archived.
+# Events only expire when their end_time is an ISO date, other formats
+# do not sort by date. Registrations, favorites and shares follow their
+# archived events and users are only archived once none of their events are left
+ARCHIVED_ROWS = {
+    "event": (
+        "canceled = 1 OR (end_time GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' "
+        "AND end_time < :cutoff)"
+    ),
+    "event_registration": (
+        "canceled = 1 OR NOT EXISTS "
+        "(SELECT 1 FROM event WHERE event.id = event_registration.event_id)"
+    ),
+    "event_favorite": (
+        "canceled = 1 OR NOT EXISTS "
+        "(SELECT 1 FROM event WHERE event.id = event_favorite.event_id)"
+    ),
+    "event_share": (
+        "NOT EXISTS (SELECT 1 FROM event WHERE event.id = event_share.event_id)"
+    ),
+    "user": (
+        "canceled = 1 AND NOT EXISTS (SELECT 1 FROM event WHERE "
+        'event.create_user_id = "user".id)'
+    ),
+}
+
+# Archived events get the next change_seqs, the same sequence the event
+# triggers continue, so clients whose cursor is past their last change
+# still receive them as deleted
+NEXT_CHANGE_SEQ = (
+    "(SELECT IFNULL(MAX(change_seq), 0) FROM ("
+    "SELECT MAX(change_seq) AS change_seq FROM event "
+    "UNION ALL SELECT MAX(change_seq) FROM archived_event"
+    ")) + ROW_NUMBER() OVER (ORDER BY rowid)"
+)
+
+
+def table_columns(connection, table: str) -> list:
+    """Get the column names of a table."""
+    return [row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')]
+
+
+def create_archive_table(table: str, engine=None):
+    """
+    Create the archive table of a table when it is missing.
+
+    The archive table has the columns of the table and an archive_time,
+    columns added to the table after its archive table was created
+    are added to the archive table
+
+    Args:
+        table: the name of the table
+        engine: the engine of the database, defaults to the application engine
+    """
+    engine = engine or db.engine
+
+    with engine.begin() as connection:
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "archived_{table}" AS '
+            f'SELECT *, NULL AS archive_time FROM "{table}" WHERE 0'
+        )
+        archived = table_columns(connection, f"archived_{table}")
+
+        for column in table_columns(connection, table):
+            if column not in archived:
+                connection.execute(
+                    f'ALTER TABLE "archived_{table}" ADD COLUMN {column}'
+                )
+
+        if table == "event":
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_archived_event_change_seq "
+                "ON archived_event (change_seq)"
+            )
+
+
+def archive_table(
+    table: str,
+    cutoff: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = 0,
+    engine=None,
+) -> int:
+    """
+    Move the rows of a table that are no longer needed to its archive table.
+
+    The table is walked in rowid order, one range of batch_size rows per
+    transaction, so the write lock is only held for a short time and
+    other requests can write between batches
+
+    Args:
+        table: the name of the table
+        cutoff: the end time before which events are archived
+        batch_size: the number of rows checked per transaction
+        pause: the number of seconds to wait between transactions
+        engine: the engine of the database, defaults to the application engine
+
+    Returns:
+        the number of archived rows
+    """
+    engine = engine or db.engine
+    create_archive_table(table, engine)
+
+    with engine.connect() as connection:
+        names = table_columns(connection, table)
+
+    columns = ", ".join(names)
+    values = ", ".join(
+        NEXT_CHANGE_SEQ if name == "change_seq" else name for name in names
+    )
+
+    rows = (
+        f'FROM "{table}" WHERE rowid > :after AND rowid <= :upto '
+        f"AND ({ARCHIVED_ROWS[table]})"
+    )
+    archived = 0
+    after = 0
+
+    while True:
+        with engine.begin() as connection:
+            upto = connection.execute(
+                f'SELECT MAX(rowid) FROM (SELECT rowid FROM "{table}" '
+                "WHERE rowid > :after ORDER BY rowid LIMIT :limit)",
+                after=after,
+                limit=batch_size,
+            ).scalar()
+
+            if upto is None:
+                return archived
+
+            parameters = {
+                "after": after,
+                "upto": upto,
+                "cutoff": cutoff,
+                "archive_time": datetime.utcnow().isoformat(),
+            }
+            connection.execute(
+                f'INSERT INTO "archived_{table}" ({columns}, archive_time) '
+                f"SELECT {values}, :archive_time {rows}",
+                **parameters,
+            )
+            archived += connection.execute(f"DELETE {rows}", **parameters).rowcount
+
+        after = upto
+
+        if pause:
+            time.sleep(pause)
+
+
+def compact(full: bool = False, engine=None) -> bool:
+    """
+    Release the free pages of the database and update the planner statistics.
+
+    Free pages are released in chunks by an incremental vacuum, which only
+    works once the database uses incremental auto vacuum. Databases created
+    before it was enabled switch to it with a full VACUUM, which locks the
+    database for its whole duration and can renumber rowids,
+    so the search and spatial indexes are rebuilt afterwards
+
+    Args:
+        full: True to switch the database to incremental auto vacuum
+        engine: the engine of the database, defaults to the application engine
+
+    Returns:
+        bool: True if free pages were released
+    """
+    from api.migrations import rebuild_event_search, rebuild_event_location
+
+    engine = engine or db.engine
+    incremental = engine.execute("PRAGMA auto_vacuum").scalar() == 2
+
+    if full and not incremental:
+        engine.execute("VACUUM")
+        incremental = engine.execute("PRAGMA auto_vacuum").scalar() == 2
+
+        if engine is db.engine:
+            rebuild_event_search()
+            rebuild_event_location()
+
+    if incremental:
+        while engine.execute("PRAGMA freelist_count").scalar():
+            engine.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+
+    with engine.connect() as connection:
+        connection.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        connection.execute("ANALYZE")
+
+    return incremental
+
+
+def archive(
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pause: float = 0,
+    full_vacuum: bool = False,
+    engine=None,
+    progress: Optional[Callable] = None,
+) -> Dict[str, int]:
+    """
+    Archive the canceled rows and past events, then compact the database.
+
+    Args:
+        retention_days: the number of days events are kept after they end
+        batch_size: the number of rows checked per transaction
+        pause: the number of seconds to wait between transactions
+        full_vacuum: True to switch the database to incremental auto vacuum
+        engine: the engine of the database, defaults to the application engine
+        progress: called with the table name and number of archived rows
+
+    Returns:
+        the number of archived rows of each table
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+    archived = {}
+
+    for table in ARCHIVED_ROWS:
+        archived[table] = archive_table(table, cutoff, batch_size, pause, engine)
+
+        if progress:
+            progress(table, archived[table])
+
+    compact(full_vacuum, engine)
+    return archived
@@ -0,0 +1,150 @@
+import glob
+import json
+import os
+import queue
+import socket
+import threading
+from api import BROKER_DIRECTORY
+from api.constants import SUBSCRIBER_QUEUE_SIZE
+
+
+MAX_MESSAGE_SIZE = 65536
+
+
+class Broker:
+    """
+    Class that represents an in-process publish and subscribe broker.
+
+        Every subscriber has a bounded queue, a subscriber that falls
+        behind loses messages instead of slowing down the publishers.
+
+        When a directory is set, messages are also sent to the brokers
+        of the other worker processes through a unix datagram socket
+        that each process binds in the directory once it has subscribers
+
+        Attributes:
+            directory: the directory of the worker sockets, None for this process only
+            subscribers: the queue of each subscriber
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.receiver = None
+        self.pid = None
+
+    def subscribe(self) -> queue.Queue:
+        """
+        Start receiving the published messages.
+
+        Returns:
+            the queue the messages are put in
+        """
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+        with self.lock:
+            self.subscribers.add(subscriber)
+
+            # A forked worker can not share the socket of its parent
+            if self.directory and self.pid != os.getpid():
+                self.listen()
+
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        """Stop putting messages in the queue of a subscriber."""
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, message: dict):
+        """
+        Send a message to the subscribers of every worker process.
+
+        Args:
+            message: the JSON serializable message
+        """
+        self.deliver(message)
+
+        if self.directory:
+            self.send(json.dumps(message).encode())
+
+    def deliver(self, message: dict):
+        """Put a message in the queues of the subscribers of this process."""
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass
+
+    def socket_path(self, pid: int) -> str:
+        """Get the path of the socket of a worker process."""
+        return os.path.join(self.directory, f"broker-{pid}.sock")
+
+    def listen(self):
+        """Bind the socket of this process and receive the other workers messages."""
+        self.pid = os.getpid()
+        path = self.socket_path(self.pid)
+
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.receiver.bind(path)
+        threading.Thread(
+            target=self.receive, args=(self.receiver,), daemon=True
+        ).start()
+
+    def receive(self, receiver: socket.socket):
+        """Deliver the messages sent by the other workers."""
+        while True:
+            self.deliver(json.loads(receiver.recv(MAX_MESSAGE_SIZE)))
+
+    def send(self, data: bytes):
+        """Send a message to the sockets of the other worker processes."""
+        own = self.socket_path(os.getpid())
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+            # A worker that is not reading loses the message instead of blocking
+            sender.setblocking(False)
+
+            for path in glob.glob(os.path.join(self.directory, "broker-*.sock")):
+                if path == own:
+                    continue
+
+                try:
+                    sender.sendto(data, path)
+                except ConnectionRefusedError:
+                    # The socket of a worker that exited
+                    os.remove(path)
+                except (FileNotFoundError, BlockingIOError):
+                    pass
+
+
+broker = Broker(BROKER_DIRECTORY)
+
+
+def publish_events(action: str, event_ids: list):
+    """
+    Publish the creation, update or cancelation of events.
+
+    Args:
+        action: created, updated or canceled
+        event_ids: the ids of the events
+    """
+    for event_id in event_ids:
+        broker.publish({"type": "event", "action": action, "id": event_id})
+
+
+def publish_metrics(event_ids: list):
+    """
+    Publish a change of the registrations, favorites or shares of events.
+
+    Args:
+        event_ids: the ids of the events
+    """
+    for event_id in event_ids:
+        broker.publish({"type": "metrics", "id": event_id})
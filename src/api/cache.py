@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Callable, Hashable, Optional
+
+
+class Cache:
+    """
+    Class that represents a process local cache.
+
+        Values are computed on the first lookup of a key and kept until
+        the cache is cleared or, when a time to live is set, until they
+        expire. The time to live bounds how long a value can be stale
+        when it is changed by another worker process
+
+        Attributes:
+            ttl: the number of seconds a value is kept, None to keep it until cleared
+            size: the maximum number of values kept, None for no limit
+    """
+
+    def __init__(self, ttl: Optional[float] = None, size: Optional[int] = None):
+        self.ttl = ttl
+        self.size = size
+        self.values = {}
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, load: Callable):
+        """
+        Get the cached value of a key, loading it when missing or expired.
+
+        Args:
+            key: the key of the value
+            load: called without arguments to compute a missing value
+
+        Returns:
+            the value of the key
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            cached = self.values.get(key)
+            generation = self.generation
+
+        if cached and (self.ttl is None or now - cached[1] < self.ttl):
+            return cached[0]
+
+        value = load()
+
+        with self.lock:
+            # A value loaded while the cache was cleared may already be stale
+            if generation == self.generation:
+                self.values.pop(key, None)
+                self.values[key] = (value, now)
+
+                # Values are kept in insertion order so the oldest is first
+                if self.size is not None and len(self.values) > self.size:
+                    del self.values[next(iter(self.values))]
+
+        return value
+
+    def discard(self, key: Hashable):
+        """Remove the value of a key from the cache."""
+        with self.lock:
+            self.values.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        """Remove every value from the cache."""
+        with self.lock:
+            self.values.clear()
+            self.generation += 1
+
+
+event_caches = []
+
+
+def event_cache(ttl: Optional[float] = None, size: Optional[int] = None) -> Cache:
+    """
+    Create a cache of values computed from the event table.
+
+    Args:
+        ttl: the number of seconds a value is kept
+        size: the maximum number of values kept
+
+    Returns:
+        a cache cleared whenever events change
+    """
+    cache = Cache(ttl, size)
+    event_caches.append(cache)
+    return cache
+
+
+def events_changed():
+    """Clear the caches of values computed from the event table."""
+    for cache in event_caches:
+        cache.clear()
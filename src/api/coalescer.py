@@ -0,0 +1,158 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Callable, Optional
+from flask import jsonify
+from api import app, db, GROUP_COMMIT_MS, GROUP_COMMIT_SIZE, GROUP_COMMIT_TIMEOUT
+from api.constants import CONTENT_TYPE, UNAVAILABLE_ERROR
+from api.metrics import metrics, observe
+
+
+class WriteCoalescer:
+    """
+    Class that represents a group commit of the small writes of a process.
+
+        The writes of concurrent requests are queued and run by a single
+        thread in one transaction, committed when the interval has passed
+        since the first queued write or when size writes are queued.
+        SQLite has a single writer and syncs every commit to disk, so one
+        commit for many writes raises the number of writes per second.
+
+        When the transaction of a batch fails its writes are run again
+        one transaction each, so only the requests of the failing writes fail.
+        A write that is not committed within the timeout raises a TimeoutError
+
+        Attributes:
+            interval: the number of seconds a write waits for other writes
+            size: the maximum number of writes committed together
+            timeout: the number of seconds a write waits for its commit,
+                None to wait forever
+    """
+
+    def __init__(self, interval: float, size: int, timeout: Optional[float] = None):
+        self.interval = interval
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.writes = None
+        self.pid = None
+
+    def submit(self, write: Callable, *args):
+        """
+        Run a write in the next batch and wait for the batch to be committed.
+
+        Args:
+            write: the function making the write with db.session
+            args: the arguments of the function
+
+        Raises:
+            TimeoutError: when the batch is not committed within the timeout
+
+        Returns:
+            the value returned by the function
+        """
+        with self.lock:
+            # A forked worker does not have the thread of its parent
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.writes = queue.Queue()
+                threading.Thread(
+                    target=self.run, args=(self.writes,), daemon=True
+                ).start()
+
+        future = Future()
+        self.writes.put((write, args, future))
+        return future.result(timeout=self.timeout)
+
+    def run(self, writes: queue.Queue):
+        """Commit the queued writes in batches."""
+        while True:
+            batch = [writes.get()]
+            deadline = time.monotonic() + self.interval
+
+            while len(batch) < self.size:
+                timeout = deadline - time.monotonic()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(writes.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self.flush(batch)
+            except Exception as error:
+                # e.g. a failed rollback, the thread keeps serving the next batches
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def flush(self, batch: list):
+        """
+        Run a batch of writes in one transaction.
+
+        Args:
+            batch: the write, arguments and future of each write
+        """
+        metrics.observe("isea_group_commit_writes", (), len(batch))
+
+        with app.app_context(), observe("group_commit"):
+            try:
+                results = [write(*args) for write, args, _ in batch]
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+            else:
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+
+                return
+
+            for write, args, future in batch:
+                try:
+                    result = write(*args)
+                    db.session.commit()
+                except Exception as error:
+                    db.session.rollback()
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+coalescer = (
+    WriteCoalescer(GROUP_COMMIT_MS / 1000, GROUP_COMMIT_SIZE, GROUP_COMMIT_TIMEOUT)
+    if GROUP_COMMIT_MS
+    else None
+)
+
+
+@app.errorhandler(TimeoutError)
+def write_timeout(error):
+    """Respond to a write that was not committed in time."""
+    return jsonify(UNAVAILABLE_ERROR), 503, CONTENT_TYPE
+
+
+def commit_write(write: Callable, *args):
+    """
+    Run a write and commit it.
+
+    When group commit is enabled the write is committed together
+    with the writes of the concurrent requests of this process
+
+    Args:
+        write: the function making the write with db.session
+        args: the arguments of the function
+
+    Returns:
+        the value returned by the function
+    """
+    if coalescer:
+        return coalescer.submit(write, *args)
+
+    result = write(*args)
+    db.session.commit()
+    return result
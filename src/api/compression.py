@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+from flask import request
+from api import app, COMPRESSION_MIN_SIZE, GZIP_LEVEL, BROTLI_QUALITY
+from api.cache import Cache
+from api.constants import COMPRESSION_CACHE_SIZE
+from api.metrics import metrics, labels, observe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ENCODINGS = ["br", "gzip"] if brotli else ["gzip"]
+
+compressed_cache = Cache(size=COMPRESSION_CACHE_SIZE)
+
+
+def compress_body(data: bytes, encoding: str) -> bytes:
+    """
+    Compress a response body.
+
+    Args:
+        data: the response body
+        encoding: br or gzip
+
+    Returns:
+        the compressed body
+    """
+    with observe(f"{encoding}_compress"):
+        if encoding == "br":
+            return brotli.compress(data, quality=BROTLI_QUALITY)
+
+        # mtime is fixed so the same body is always compressed to the same bytes
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compressible(response) -> bool:
+    """Check if a response body can be compressed."""
+    return not (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+    )
+
+
+@app.after_request
+def compress(response):
+    """
+    Compress the response body with the best encoding accepted by the client.
+
+    Bodies smaller than COMPRESSION_MIN_SIZE are sent as is since compressing
+    them saves less than it costs. The compressed bodies of GET responses are
+    cached by content so an unchanged list is compressed once
+    """
+    if not compressible(response):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    data = response.get_data()
+
+    if not encoding or len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    if request.method == "GET":
+        key = (encoding, hashlib.blake2b(data, digest_size=16).digest())
+        compressed = compressed_cache.get(key, lambda: compress_body(data, encoding))
+    else:
+        compressed = compress_body(data, encoding)
+
+    metrics.add(
+        "isea_response_bytes_total",
+        labels(encoding=encoding, body="original"),
+        len(data),
+    )
+    metrics.add(
+        "isea_response_bytes_total",
+        labels(encoding=encoding, body="compressed"),
+        len(compressed),
+    )
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
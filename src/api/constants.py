@@ -4,3 +4,21 @@ CRITICAL_ERROR = {"error": "Critical Error"}
 NOT_FOUND_ERROR = {"error": "Result Not Found"}
 ALREADY_EXISTS_ERROR = {"error": "{} Not Possible To Create"}
 LOGIN_ERROR = {"error": "Username or Password is invalid"}
+UNAUTHORIZED_ERROR = {"error": "Unauthorized"}
+PRECONDITION_FAILED_ERROR = {"error": "Event Was Modified"}
+PRECONDITION_REQUIRED_ERROR = {"error": "If-Match Header Required"}
+UNAVAILABLE_ERROR = {"error": "Service Unavailable"}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+DEFAULT_CHANGES_PAGE_SIZE = 500
+MAX_BULK_EVENTS = 1000
+MAX_CHANGES_PAGE_SIZE = 1000
+CATEGORY_CACHE_TTL = 5
+CATEGORY_CACHE_SIZE = 1000
+ROLE_CACHE_TTL = 30
+USER_ROLE_CACHE_SIZE = 10000
+SUBSCRIBER_QUEUE_SIZE = 1000
+STREAM_HEARTBEAT = 15
+COMPRESSION_CACHE_SIZE = 64
+DEFAULT_NEARBY_RADIUS = 5
+MAX_NEARBY_RADIUS = 500
@@ -0,0 +1,126 @@
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request
+from api import (
+    app,
+    PROFILE_DIRECTORY,
+    PROFILE_TOKEN,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_FORMAT,
+)
+
+
+PROFILE_REQUEST_HEADER = "X-Profile-Token"
+PROFILE_RESPONSE_HEADER = "X-Profile"
+SAMPLE_INTERVAL = 0.001
+
+
+class StackSampler(threading.Thread):
+    """
+    Class that represents a sampling profiler of a single thread.
+
+        The stack of the profiled thread is recorded every interval
+        and counted in the collapsed stack format used by flamegraph tools
+
+        Attributes:
+            thread_id: the id of the profiled thread
+            interval: the number of seconds between samples
+            stacks: the number of samples of each collapsed stack
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        """Sample the stack of the profiled thread until disabled."""
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+
+            while frame:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        """Start sampling."""
+        self.start()
+
+    def disable(self):
+        """Stop sampling."""
+        self.stopped.set()
+        self.join()
+
+    def dump_stats(self, path: str):
+        """Write the collapsed stacks and their number of samples to a file."""
+        with open(path, "w") as collapsed:
+            for stack, count in self.stacks.items():
+                collapsed.write(f"{stack} {count}\n")
+
+
+def profile_requested() -> bool:
+    """
+    Check if the current request should be profiled.
+
+    A request is profiled when it has the configured profile token
+    or when it is picked by the sample rate
+
+    Returns:
+        bool: True if the request should be profiled
+    """
+    token = request.headers.get(PROFILE_REQUEST_HEADER)
+
+    if token and PROFILE_TOKEN and hmac.compare_digest(token, PROFILE_TOKEN):
+        return True
+
+    return random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    """Start profiling the current request when requested."""
+    if not profile_requested():
+        return
+
+    if PROFILE_FORMAT == "collapsed":
+        g.cpu_profile = StackSampler(threading.get_ident())
+    else:
+        g.cpu_profile = cProfile.Profile()
+
+    g.cpu_profile.enable()
+
+
+def write_profile(response):
+    """Stop profiling the current request and write the profile of its route."""
+    profile = g.pop("cpu_profile", None)
+
+    if not profile:
+        return response
+
+    profile.disable()
+    directory = os.path.join(PROFILE_DIRECTORY, request.endpoint or "unmatched")
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{time.time_ns()}-{os.getpid()}.{PROFILE_FORMAT}"
+    profile.dump_stats(os.path.join(directory, filename))
+    response.headers[PROFILE_RESPONSE_HEADER] = filename
+    return response
+
+
+if PROFILE_DIRECTORY:
+    app.before_request(start_profile)
+    app.after_request(write_profile)
@@ -1,5 +1,5 @@
 from functools import wraps
-from flask import jsonify
+from flask import g, jsonify, request
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from marshmallow import ValidationError
@@ -8,8 +8,10 @@ from api.constants import (
     CRITICAL_ERROR,
     CONTENT_TYPE,
     BAD_REQUEST_ERROR,
+    UNAUTHORIZED_ERROR,
 )
-from api import db
+from api import db, TOKEN_REQUIRED
+from api.tokens import read_token
 
 
 def one_result(func):
@@ -77,3 +79,44 @@ def valid_result(func):
             )
 
     return call_inner
+
+
+def signed_token(func):
+    """
+    Decorator for requests that can be authorized with an access token.
+
+    This is a wrapper around route functions that accept the signed
+    token returned by the login in an Authorization: Bearer header.
+
+    The token is verified without a database query and its claims are
+    stored in g.token, None when the request has no token.
+    Requests with an invalid or expired token are rejected, and so are
+    requests without a token when TOKEN_REQUIRED is set
+    """
+
+    @wraps(func)
+    def call_inner(*args, **kwargs):
+        header = request.headers.get("Authorization")
+        g.token = None
+
+        if not header and TOKEN_REQUIRED:
+            return (
+                jsonify(UNAUTHORIZED_ERROR),
+                401,
+                CONTENT_TYPE,
+            )
+
+        if header:
+            scheme, _, token = header.partition(" ")
+            g.token = read_token(token) if scheme.lower() == "bearer" else None
+
+            if not g.token:
+                return (
+                    jsonify(UNAUTHORIZED_ERROR),
+                    401,
+                    CONTENT_TYPE,
+                )
+
+        return func(*args, **kwargs)
+
+    return call_inner
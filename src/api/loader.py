@@ -0,0 +1,365 @@
+import csv
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from argon2 import PasswordHasher
+from marshmallow import ValidationError
+from sqlalchemy import bindparam, text
+from api import db
+from api.models import (
+    UserRole,
+    User,
+    Event,
+    user_role_schema,
+    user_input_schema,
+    event_schema,
+    required_columns,
+)
+
+
+DEFAULT_BATCH_SIZE = 50000
+
+# The triggers that index each inserted event, and the statements that
+# index all the events of a batch inserted after a rowid at once
+EVENT_INSERT_TRIGGERS = {
+    "event_search_insert": """
+        INSERT INTO event_search (rowid, description, category, location)
+        SELECT rowid, description, category, location FROM event
+        WHERE rowid > :after
+    """,
+    "event_location_insert": """
+        INSERT INTO event_location
+        SELECT rowid, latitude, latitude, longitude, longitude FROM event
+        WHERE rowid > :after AND latitude IS NOT NULL AND longitude IS NOT NULL
+    """,
+    "event_change_insert": """
+        UPDATE event SET change_seq = rowid - :after + (
+            SELECT IFNULL(MAX(change_seq), 0) FROM (
+                SELECT MAX(change_seq) AS change_seq FROM event
+                UNION ALL SELECT MAX(change_seq) FROM archived_event
+            )
+        )
+        WHERE rowid > :after
+    """,
+}
+
+TABLES = {
+    "roles": (UserRole, user_role_schema),
+    "users": (User, user_input_schema),
+    "events": (Event, event_schema),
+}
+
+
+def read_rows(path: str) -> Iterator[Dict]:
+    """
+    Read the rows of a CSV or JSONL file.
+
+    Empty CSV values are returned as None so they are treated
+    the same way as missing values
+
+    Args:
+        path: the path of a .csv, .jsonl or .json file
+
+    Returns:
+        an iterator over the rows of the file as dicts
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="") as source:
+            for row in csv.DictReader(source):
+                yield {
+                    key: (value if value != "" else None) for key, value in row.items()
+                }
+
+    else:
+        with open(path) as source:
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_checkpoint(path: str) -> int:
+    """
+    Get the number of source rows already committed by a previous load.
+
+    Args:
+        path: the path of the checkpoint file
+
+    Returns:
+        the number of rows to skip, 0 if there is no checkpoint
+    """
+    if not os.path.exists(path):
+        return 0
+
+    with open(path) as checkpoint:
+        return int(checkpoint.read().strip() or 0)
+
+
+def write_checkpoint(path: str, rows: int):
+    """
+    Record the number of source rows committed so far.
+
+    The file is replaced atomically so an interrupted load never
+    leaves a partially written checkpoint behind
+
+    Args:
+        path: the path of the checkpoint file
+        rows: the number of source rows committed
+    """
+    with open(path + ".tmp", "w") as checkpoint:
+        checkpoint.write(str(rows))
+
+    os.replace(path + ".tmp", path)
+
+
+def report_progress(table: str, inserted: int, rejected: int, started: float):
+    """Write the progress of a load to stderr."""
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    sys.stderr.write(
+        f"{table}: {inserted} rows inserted, {rejected} rejected "
+        f"({int(inserted / elapsed)} rows/s)\n"
+    )
+
+
+class RowContext:
+    """
+    Class that stands in for the execution context of an insert.
+
+        Column default functions that read the inserted values get
+        them from here while the defaults of a row are being filled in
+
+        Attributes:
+            parameters: the values of the row being inserted
+    """
+
+    def __init__(self, parameters: Dict):
+        self.parameters = parameters
+
+    def get_current_parameters(self) -> Dict:
+        return self.parameters
+
+
+class RowPreparer:
+    """
+    Class that validates source rows and turns them into insert parameters.
+
+        Every prepared row contains every column of the table so
+        the whole batch can be sent with a single executemany
+
+        Attributes:
+            table: the name of the table being loaded
+            model: the model of the table being loaded
+            schema: the marshmallow schema used to validate rows
+            columns: the columns of the table
+            required: the names of the columns that must be provided
+    """
+
+    def __init__(self, table: str):
+        self.table = table
+        self.model, self.schema = TABLES[table]
+        self.columns = list(self.model.__table__.columns)
+        self.required = required_columns(self.model)
+        self.hasher = PasswordHasher()
+
+    def prepare(self, row: Dict) -> Dict:
+        """
+        Validate a row and fill in the column defaults.
+
+        Args:
+            row: the source row
+
+        Raises:
+            ValidationError: when the row does not match the table schema
+
+        Returns:
+            the insert parameters of the row
+        """
+        data = self.schema.load(
+            {key: value for key, value in row.items() if value is not None}
+        )
+        missing = [name for name in self.required if data.get(name) is None]
+
+        if missing:
+            raise ValidationError({name: ["Missing data."] for name in missing})
+
+        if self.table == "users":
+            data["username"] = data["username"].lower()
+
+            if not data["password"].startswith("$argon2"):
+                data["password"] = self.hasher.hash(data["password"])
+
+        for column in self.columns:
+            if data.get(column.name) is None and column.default is not None:
+                default = column.default.arg
+                data[column.name] = (
+                    default(RowContext(data)) if callable(default) else default
+                )
+
+        return {column.name: data.get(column.name) for column in self.columns}
+
+
+def insert_events(connection, insert, batch: List[Dict]) -> int:
+    """
+    Insert a batch of events and index them once for the whole batch.
+
+    The search, spatial and change triggers run a few statements for each
+    inserted event, so they are dropped for the insert and the inserted
+    events are indexed with one statement per trigger. The triggers are
+    created again in the same transaction, a failed batch leaves them
+    in place. The write lock is taken first so the events of other
+    writers can not be inserted between the triggers being dropped
+    and created again
+
+    Args:
+        connection: the connection of the transaction of the batch
+        insert: the insert statement of the event table
+        batch: the insert parameters of the events
+
+    Returns:
+        the number of inserted events
+    """
+    # pysqlite only opens the transaction before a data change
+    connection.execute("DELETE FROM event WHERE 0")
+    triggers = connection.execute(
+        text(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'trigger' AND name IN :names"
+        ).bindparams(bindparam("names", expanding=True)),
+        names=list(EVENT_INSERT_TRIGGERS),
+    ).fetchall()
+
+    for name, _ in triggers:
+        connection.execute(f"DROP TRIGGER {name}")
+
+    after = connection.execute("SELECT IFNULL(MAX(rowid), 0) FROM event").scalar()
+    count = connection.execute(insert, batch).rowcount
+
+    for name, sql in triggers:
+        connection.execute(text(EVENT_INSERT_TRIGGERS[name]), after=after)
+        connection.execute(sql)
+
+    return count
+
+
+def insert_rows(
+    table: str,
+    rows: Iterable[Dict],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    engine=None,
+    progress: Callable = report_progress,
+    skip: int = 0,
+    on_commit: Optional[Callable] = None,
+) -> Dict:
+    """
+    Bulk insert rows into a table.
+
+    Rows are validated with the table schema and inserted with one
+    executemany per batch, each batch committed in its own transaction.
+    Rows that collide with an existing primary key or unique value are
+    ignored so loading the same rows twice is harmless
+
+    Args:
+        table: one of "roles", "users" or "events"
+        rows: the rows to insert
+        batch_size: the number of rows inserted per transaction
+        engine: the engine to load into, defaults to the application engine
+        progress: called with the table, inserted, rejected and start time per batch
+        skip: the number of leading rows to skip
+        on_commit: called with the number of rows consumed after each commit
+
+    Returns:
+        the number of inserted, ignored, rejected and skipped rows
+    """
+    engine = engine or db.engine
+    preparer = RowPreparer(table)
+    insert = preparer.model.__table__.insert().prefix_with("OR IGNORE")
+
+    position = 0
+    inserted = 0
+    ignored = 0
+    rejected = 0
+    batch: List[Dict] = []
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal inserted, ignored
+
+        if batch:
+            with engine.begin() as connection:
+                if table == "events":
+                    count = insert_events(connection, insert, batch)
+                else:
+                    count = connection.execute(insert, batch).rowcount
+
+            inserted += count
+            ignored += len(batch) - count
+            batch.clear()
+
+        if on_commit:
+            on_commit(position)
+
+        progress(table, inserted, rejected, started)
+
+    for row in rows:
+        position += 1
+
+        if position <= skip:
+            continue
+
+        try:
+            batch.append(preparer.prepare(row))
+        except (ValidationError, KeyError, AttributeError):
+            rejected += 1
+
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+
+    return {
+        "inserted": inserted,
+        "ignored": ignored,
+        "rejected": rejected,
+        "skipped": min(skip, position),
+    }
+
+
+def load_file(
+    table: str,
+    path: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint: Optional[str] = None,
+    engine=None,
+    progress: Callable = report_progress,
+) -> Dict:
+    """
+    Bulk load the rows of a file into a table.
+
+    The number of committed source rows is recorded in the checkpoint
+    file after every batch so an interrupted load resumes where it
+    stopped. The checkpoint is removed once the whole file is loaded
+
+    Args:
+        table: one of "roles", "users" or "events"
+        path: the path of a .csv or .jsonl file with the rows to load
+        batch_size: the number of rows inserted per transaction
+        checkpoint: the checkpoint file, defaults to the path + ".checkpoint"
+        engine: the engine to load into, defaults to the application engine
+        progress: called with the table, inserted, rejected and start time per batch
+
+    Returns:
+        the number of inserted, ignored, rejected and skipped rows
+    """
+    checkpoint = checkpoint or path + ".checkpoint"
+    result = insert_rows(
+        table,
+        read_rows(path),
+        batch_size=batch_size,
+        engine=engine,
+        progress=progress,
+        skip=read_checkpoint(checkpoint),
+        on_commit=lambda position: write_checkpoint(checkpoint, position),
+    )
+    os.remove(checkpoint)
+    return result
@@ -0,0 +1,412 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from api import app, METRICS_DIRECTORY
+
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+SNAPSHOT_INTERVAL = 1
+
+METRICS = {
+    "isea_http_requests_total": (
+        "counter",
+        "Number of requests by route, method and status",
+    ),
+    "isea_http_requests_in_flight": (
+        "gauge",
+        "Number of requests being handled",
+    ),
+    "isea_http_request_duration_seconds": (
+        "histogram",
+        "Request latency by route",
+    ),
+    "isea_db_duration_seconds": (
+        "histogram",
+        "Time spent executing SQL per request by route",
+    ),
+    "isea_db_queries": (
+        "histogram",
+        "Number of SQL statements executed per request by route",
+    ),
+    "isea_operation_duration_seconds": (
+        "histogram",
+        "Duration of slow operations such as password hashing and sending email",
+    ),
+    "isea_response_bytes_total": (
+        "counter",
+        "Size of the compressed response bodies before and after compression",
+    ),
+    "isea_group_commit_writes": (
+        "histogram",
+        "Number of writes committed in one transaction by the group commit",
+    ),
+}
+
+BUCKETS = {
+    "isea_http_request_duration_seconds": SECONDS_BUCKETS,
+    "isea_db_duration_seconds": SECONDS_BUCKETS,
+    "isea_db_queries": QUERY_BUCKETS,
+    "isea_operation_duration_seconds": SECONDS_BUCKETS,
+    "isea_group_commit_writes": QUERY_BUCKETS,
+}
+
+
+class Metrics:
+    """
+    Class that represents the metrics of this process.
+
+        Every update is made under a lock so the metrics can be
+        updated by the threads of a threaded server
+
+        Attributes:
+            values: the value of each counter and gauge by name and labels
+            histograms: the bucket counts, sum and count of each histogram
+            changes: the number of updates, unchanged metrics are not stored again
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.histograms = {}
+        self.changes = 0
+        self.lock = threading.Lock()
+
+    def add(self, name: str, labels: tuple, value: float = 1):
+        """
+        Add to a counter or gauge.
+
+        Args:
+            name: the name of the metric
+            labels: the label names and values of the metric
+            value: the amount to add
+        """
+        with self.lock:
+            self.values[(name, labels)] = self.values.get((name, labels), 0) + value
+            self.changes += 1
+
+    def observe(self, name: str, labels: tuple, value: float):
+        """
+        Record a value in a histogram.
+
+        Args:
+            name: the name of the metric
+            labels: the label names and values of the metric
+            value: the observed value
+        """
+        buckets = BUCKETS[name]
+
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                (name, labels), [0] * (len(buckets) + 2)
+            )
+
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+
+            histogram[-2] += value
+            histogram[-1] += 1
+            self.changes += 1
+
+    def snapshot(self) -> dict:
+        """
+        Get a copy of the metrics that can be stored as JSON.
+
+        Returns:
+            the values and histograms as lists of name, labels and value
+        """
+        with self.lock:
+            return {
+                "values": [
+                    [name, labels, value]
+                    for (name, labels), value in self.values.items()
+                ],
+                "histograms": [
+                    [name, labels, list(histogram)]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+
+metrics = Metrics()
+snapshot_lock = threading.Lock()
+snapshot_pid = None
+
+
+def labels(**values) -> tuple:
+    """Get the labels of a metric in a stable order."""
+    return tuple(sorted((name, str(value)) for name, value in values.items()))
+
+
+@contextmanager
+def observe(operation: str):
+    """
+    Record the duration of an operation.
+
+    Args:
+        operation: the name of the operation, e.g. argon2_hash
+    """
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        metrics.observe(
+            "isea_operation_duration_seconds",
+            labels(operation=operation),
+            time.perf_counter() - start,
+        )
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    """Record the start time of a SQL statement."""
+    conn.info.setdefault("query_start", {})[id(cursor)] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def end_query(conn, cursor, statement, parameters, context, executemany):
+    """Add the duration of a SQL statement to the current request."""
+    duration = time.perf_counter() - conn.info["query_start"].pop(id(cursor))
+
+    if has_request_context() and "request_start" in g:
+        g.db_queries += 1
+        g.db_duration += duration
+
+
+@event.listens_for(Engine, "handle_error")
+def fail_query(context):
+    """Forget the start time of a SQL statement that failed."""
+    cursor = getattr(context.execution_context, "cursor", None)
+
+    if context.connection is not None and cursor is not None:
+        context.connection.info.get("query_start", {}).pop(id(cursor), None)
+
+
+@app.before_request
+def start_request():
+    """Record the start of a request."""
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_duration = 0.0
+    metrics.add("isea_http_requests_in_flight", ())
+
+
+@app.after_request
+def end_request(response):
+    """Record the latency, status and database usage of a request."""
+    if "request_start" in g:
+        route = labels(endpoint=request.endpoint or "unmatched", method=request.method)
+        metrics.observe(
+            "isea_http_request_duration_seconds",
+            route,
+            time.perf_counter() - g.request_start,
+        )
+        metrics.observe("isea_db_duration_seconds", route, g.db_duration)
+        metrics.observe("isea_db_queries", route, g.db_queries)
+        metrics.add(
+            "isea_http_requests_total",
+            labels(
+                endpoint=request.endpoint or "unmatched",
+                method=request.method,
+                status=response.status_code,
+            ),
+        )
+
+    return response
+
+
+@app.teardown_request
+def teardown_request(error):
+    """Record the end of a request and share the metrics with other workers."""
+    if "request_start" not in g:
+        return
+
+    metrics.add("isea_http_requests_in_flight", (), -1)
+
+    if METRICS_DIRECTORY and snapshot_pid != os.getpid():
+        start_snapshots()
+
+
+def snapshot_path(pid: int) -> str:
+    """Get the path of the metrics snapshot of a worker process."""
+    return os.path.join(METRICS_DIRECTORY, f"metrics-{pid}.json")
+
+
+def write_snapshot() -> dict:
+    """
+    Store the metrics of this process for the other worker processes.
+
+    Returns:
+        the stored snapshot
+    """
+    path = snapshot_path(os.getpid())
+
+    # A snapshot taken earlier can not replace a newer one
+    with snapshot_lock:
+        snapshot = metrics.snapshot()
+
+        with open(path + ".tmp", "w") as stored:
+            json.dump(snapshot, stored)
+
+        os.replace(path + ".tmp", path)
+
+    return snapshot
+
+
+def write_snapshots():
+    """Store the metrics of this process after every interval they changed in."""
+    written = None
+
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+
+        if metrics.changes != written:
+            written = metrics.changes
+            write_snapshot()
+
+
+def start_snapshots():
+    """
+    Start storing the metrics of this process in the background.
+
+    The last requests of a worker before it goes idle are stored
+    without waiting for its next request
+    """
+    global snapshot_pid
+
+    with snapshot_lock:
+        # A forked worker does not have the thread of its parent
+        if snapshot_pid != os.getpid():
+            snapshot_pid = os.getpid()
+            threading.Thread(target=write_snapshots, daemon=True).start()
+
+
+def process_alive(pid: int) -> bool:
+    """Check if a process is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def collect() -> list:
+    """
+    Get the metrics of this process and of the other worker processes.
+
+    The snapshots of workers that exited are deleted, their gauges would
+    otherwise stay at their last value. Their counters are dropped from
+    the sums too, which Prometheus handles like the restart of a worker
+
+    Returns:
+        the snapshots of every running process, this process first
+    """
+    # The stored snapshot matches the reported metrics of this process,
+    # so totals do not go backwards when the next scrape is served by another worker
+    snapshots = [write_snapshot() if METRICS_DIRECTORY else metrics.snapshot()]
+
+    if METRICS_DIRECTORY:
+        own = snapshot_path(os.getpid())
+
+        for path in glob.glob(os.path.join(METRICS_DIRECTORY, "metrics-*.json")):
+            if path == own:
+                continue
+
+            pid = int(os.path.basename(path)[len("metrics-") : -len(".json")])
+
+            try:
+                if not process_alive(pid):
+                    os.remove(path)
+                    continue
+
+                with open(path) as snapshot:
+                    snapshots.append(json.load(snapshot))
+            except FileNotFoundError:
+                # Removed by another worker collecting at the same time
+                pass
+
+    return snapshots
+
+
+def merge(snapshots: list) -> tuple:
+    """
+    Sum the metrics of many processes.
+
+    Args:
+        snapshots: the snapshots of each process
+
+    Returns:
+        the summed values and histograms by name and labels
+    """
+    values = {}
+    histograms = {}
+
+    for snapshot in snapshots:
+        for name, metric_labels, value in snapshot["values"]:
+            key = (name, tuple(map(tuple, metric_labels)))
+            values[key] = values.get(key, 0) + value
+
+        for name, metric_labels, histogram in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, metric_labels)))
+            merged = histograms.setdefault(key, [0] * len(histogram))
+            histograms[key] = [a + b for a, b in zip(merged, histogram)]
+
+    return values, histograms
+
+
+def format_labels(metric_labels: tuple, **extra) -> str:
+    """Format the labels of a metric sample."""
+    pairs = list(metric_labels) + list(extra.items())
+
+    if not pairs:
+        return ""
+
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render() -> str:
+    """
+    Render the metrics of every worker process in the Prometheus text format.
+
+    Returns:
+        the metrics exposition text
+    """
+    values, histograms = merge(collect())
+    lines = []
+
+    for name, (kind, description) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        for (metric, metric_labels), value in sorted(values.items()):
+            if metric == name:
+                lines.append(f"{name}{format_labels(metric_labels)} {value}")
+
+        for (metric, metric_labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+
+            for bound, count in zip(BUCKETS[name], histogram):
+                bucket = format_labels(metric_labels, le=bound)
+                lines.append(f"{name}_bucket{bucket} {count}")
+
+            bucket = format_labels(metric_labels, le="+Inf")
+            lines.append(f"{name}_bucket{bucket} {histogram[-1]}")
+            lines.append(f"{name}_sum{format_labels(metric_labels)} {histogram[-2]}")
+            lines.append(f"{name}_count{format_labels(metric_labels)} {histogram[-1]}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,414 @@
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from api import db
+from api.archive import ARCHIVED_ROWS, create_archive_table
+from api.models import hash_description, parse_cost
+
+
+@event.listens_for(Engine, "connect")
+def set_auto_vacuum(connection, record):
+    """
+    Use incremental auto vacuum so archived rows can be released in chunks.
+
+    The setting only applies to a database created by the connection,
+    or rebuilt by a full VACUUM
+    """
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+
+def add_column(table: str, column: str, definition: str) -> bool:
+    """
+    Add a column to an existing table when it is missing.
+
+    db.create_all only creates missing tables, so columns added to
+    a model after its table was created have to be added here
+
+    Args:
+        table: the name of the table
+        column: the name of the column
+        definition: the SQL type and constraints of the column
+
+    Returns:
+        bool: True if the column was added
+    """
+    columns = [column["name"] for column in inspect(db.engine).get_columns(table)]
+
+    if column in columns:
+        return False
+
+    db.engine.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+
+def has_index(table: str, index: str) -> bool:
+    """
+    Check if a table has an index.
+
+    Args:
+        table: the name of the table
+        index: the name of the index
+
+    Returns:
+        bool: True if the index exists
+    """
+    indexes = inspect(db.engine).get_indexes(table)
+    return any(existing["name"] == index for existing in indexes)
+
+
+def backfill_description_hash():
+    """
+    Generate the description hash of the events created without one.
+
+    Events that were created before duplicates were detected
+    case insensitively can share a normalized description,
+    these keep a distinct hash suffixed with their id
+    """
+    seen = {
+        row[0]
+        for row in db.engine.execute(
+            "SELECT description_hash FROM event WHERE description_hash IS NOT NULL"
+        )
+    }
+    updates = []
+
+    for id, description in db.engine.execute(
+        "SELECT id, description FROM event WHERE description_hash IS NULL"
+    ).fetchall():
+        description_hash = hash_description(description)
+
+        if description_hash in seen:
+            description_hash = f"{description_hash}:{id}"
+
+        seen.add(description_hash)
+        updates.append({"id": id, "description_hash": description_hash})
+
+    if updates:
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "UPDATE event SET description_hash = :description_hash "
+                    "WHERE id = :id"
+                ),
+                updates,
+            )
+
+
+def backfill_cost():
+    """Parse the cost of the events created before costs were parsed."""
+    updates = [
+        dict(zip(("id", "cost_cents", "cost_currency"), (id, *parse_cost(cost))))
+        for id, cost in db.engine.execute("SELECT id, cost FROM event").fetchall()
+    ]
+
+    if updates:
+        with db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    "UPDATE event SET cost_cents = :cost_cents, "
+                    "cost_currency = :cost_currency WHERE id = :id"
+                ),
+                updates,
+            )
+
+
+def backfill_registered():
+    """Count the seated registrations of events created before seats were counted."""
+    db.engine.execute(
+        """
+        UPDATE event SET registered = (
+            SELECT COUNT(*) FROM event_registration
+            WHERE event_id = event.id AND canceled = 0 AND waitlisted IS NULL
+        )
+        """
+    )
+
+
+def deduplicate_event_users(table: str):
+    """
+    Remove the duplicate rows of a user to event table.
+
+    One row is kept for every event and user pair, it is active
+    when any of the duplicate rows was active
+
+    Args:
+        table: the name of the table
+    """
+    with db.engine.begin() as connection:
+        connection.execute(
+            f"""
+            UPDATE {table} SET canceled = 0
+            WHERE canceled = 1 AND EXISTS (
+                SELECT 1 FROM {table} AS other
+                WHERE other.event_id = {table}.event_id
+                AND other.user_id = {table}.user_id
+                AND other.canceled = 0
+            )
+            """
+        )
+        connection.execute(
+            f"""
+            DELETE FROM {table} WHERE rowid NOT IN (
+                SELECT MIN(rowid) FROM {table} GROUP BY event_id, user_id
+            )
+            """
+        )
+
+
+def create_missing_indexes():
+    """Create the indexes defined on the models that the database is missing."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if not has_index(table.name, index.name):
+                index.create(bind=db.engine)
+
+
+def has_table(table: str) -> bool:
+    """
+    Check if a table exists, including virtual tables.
+
+    Args:
+        table: the name of the table
+
+    Returns:
+        bool: True if the table exists
+    """
+    return (
+        db.engine.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", table
+        ).first()
+        is not None
+    )
+
+
+def create_event_search():
+    """
+    Create the full text search index of the events.
+
+    event_search is an FTS5 table over the description, category and
+    location of the event table, using the event rowid as its rowid.
+    Triggers keep it in sync with every insert, update and delete on
+    the event table, whichever code path makes the change.
+
+    A full VACUUM can renumber the rowids of the event table,
+    the index must be rebuilt afterwards with rebuild_event_search
+    """
+    if has_table("event_search"):
+        return
+
+    with db.engine.begin() as connection:
+        connection.execute(
+            """
+            CREATE VIRTUAL TABLE event_search USING fts5(
+                description, category, location,
+                content='event', content_rowid='rowid'
+            )
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER event_search_insert AFTER INSERT ON event BEGIN
+                INSERT INTO event_search (rowid, description, category, location)
+                VALUES (new.rowid, new.description, new.category, new.location);
+            END
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER event_search_delete AFTER DELETE ON event BEGIN
+                INSERT INTO event_search
+                (event_search, rowid, description, category, location)
+                VALUES (
+                    'delete', old.rowid, old.description, old.category, old.location
+                );
+            END
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER event_search_update
+            AFTER UPDATE OF description, category, location ON event BEGIN
+                INSERT INTO event_search
+                (event_search, rowid, description, category, location)
+                VALUES (
+                    'delete', old.rowid, old.description, old.category, old.location
+                );
+                INSERT INTO event_search (rowid, description, category, location)
+                VALUES (new.rowid, new.description, new.category, new.location);
+            END
+            """
+        )
+
+    rebuild_event_search()
+
+
+def rebuild_event_search():
+    """Rebuild the full text search index from the event table."""
+    with db.engine.begin() as connection:
+        connection.execute("INSERT INTO event_search (event_search) VALUES ('rebuild')")
+
+
+def create_event_location():
+    """
+    Create the spatial index of the events.
+
+    event_location is an R*Tree over the latitude and longitude of the
+    events that have both, using the event rowid as its id. Triggers keep
+    it in sync with every insert, update and delete on the event table.
+
+    A full VACUUM can renumber the rowids of the event table,
+    the index must be rebuilt afterwards with rebuild_event_location
+    """
+    if has_table("event_location"):
+        return
+
+    with db.engine.begin() as connection:
+        connection.execute(
+            """
+            CREATE VIRTUAL TABLE event_location USING rtree(
+                id, min_latitude, max_latitude, min_longitude, max_longitude
+            )
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER event_location_insert AFTER INSERT ON event
+            WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+                INSERT INTO event_location
+                VALUES (
+                    new.rowid, new.latitude, new.latitude, new.longitude, new.longitude
+                );
+            END
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER event_location_delete AFTER DELETE ON event BEGIN
+                DELETE FROM event_location WHERE id = old.rowid;
+            END
+            """
+        )
+        connection.execute(
+            """
+            CREATE TRIGGER event_location_update
+            AFTER UPDATE OF latitude, longitude ON event BEGIN
+                DELETE FROM event_location WHERE id = old.rowid;
+                INSERT INTO event_location
+                SELECT
+                    new.rowid, new.latitude, new.latitude, new.longitude, new.longitude
+                WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+            END
+            """
+        )
+
+    rebuild_event_location()
+
+
+def rebuild_event_location():
+    """Rebuild the spatial index from the event table."""
+    with db.engine.begin() as connection:
+        connection.execute("DELETE FROM event_location")
+        connection.execute(
+            """
+            INSERT INTO event_location
+            SELECT rowid, latitude, latitude, longitude, longitude FROM event
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            """
+        )
+
+
+def create_event_changes():
+    """
+    Create the change sequence of the events.
+
+    Triggers give an event the next change_seq whenever it is inserted
+    or any of its columns is updated, whichever code path makes the change,
+    except for the registered counter which changes with every registration.
+    SQLite has a single writer so the sequence is assigned in commit order
+    and a client that read up to a change_seq can not miss an earlier one.
+
+    Archived events are given the next change_seq when they are moved.
+    The triggers are recreated when their definition changes, e.g. when
+    a column is added to the event table
+    """
+    columns = ", ".join(
+        column.name
+        for column in db.metadata.tables["event"].columns
+        if column.name not in ("change_seq", "registered")
+    )
+    next_change = """
+        UPDATE event SET change_seq = (
+            SELECT IFNULL(MAX(change_seq), 0) + 1 FROM (
+                SELECT MAX(change_seq) AS change_seq FROM event
+                UNION ALL SELECT MAX(change_seq) FROM archived_event
+            )
+        ) WHERE rowid = new.rowid;
+    """
+
+    triggers = {
+        "event_change_insert": f"""
+            CREATE TRIGGER event_change_insert AFTER INSERT ON event BEGIN
+                {next_change}
+            END
+        """,
+        "event_change_update": f"""
+            CREATE TRIGGER event_change_update AFTER UPDATE OF {columns} ON event BEGIN
+                {next_change}
+            END
+        """,
+    }
+
+    with db.engine.begin() as connection:
+        for name, trigger in triggers.items():
+            existing = connection.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                name,
+            ).scalar()
+
+            if existing and existing.split() == trigger.split():
+                continue
+
+            connection.execute(f"DROP TRIGGER IF EXISTS {name}")
+            connection.execute(trigger)
+
+
+def upgrade_schema():
+    """
+    Bring a database created by an older version up to date.
+
+    Every step is idempotent, a database created by db.create_all
+    from the current models is left unchanged
+    """
+    if add_column("event", "description_hash", "VARCHAR"):
+        backfill_description_hash()
+
+    if add_column("event", "cost_cents", "INTEGER"):
+        add_column("event", "cost_currency", "VARCHAR")
+        backfill_cost()
+
+    add_column("event", "latitude", "FLOAT")
+    add_column("event", "longitude", "FLOAT")
+
+    if add_column("event", "change_seq", "INTEGER"):
+        db.engine.execute("UPDATE event SET change_seq = rowid")
+
+    add_column("event", "version", "INTEGER NOT NULL DEFAULT 1")
+    add_column("event", "capacity", "INTEGER")
+    add_column("event_registration", "waitlisted", "INTEGER")
+
+    for table in ("event_registration", "event_favorite"):
+        if not has_index(table, f"ix_{table}_event_id_user_id"):
+            deduplicate_event_users(table)
+
+    if add_column("event", "registered", "INTEGER NOT NULL DEFAULT 0"):
+        backfill_registered()
+
+    # Replaced by ix_event_canceled_category_start_time which also serves facets
+    db.engine.execute("DROP INDEX IF EXISTS ix_event_category_canceled_start_time")
+    create_missing_indexes()
+    create_event_search()
+    create_event_location()
+
+    for table in ARCHIVED_ROWS:
+        create_archive_table(table)
+
+    create_event_changes()
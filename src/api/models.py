@@ -1,6 +1,17 @@
 from api import db, ma, USER_ROLE_UUID
-from sqlalchemy.orm import relationship
+from marshmallow import fields, validate, EXCLUDE
+from api.constants import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    DEFAULT_CHANGES_PAGE_SIZE,
+    MAX_CHANGES_PAGE_SIZE,
+    DEFAULT_NEARBY_RADIUS,
+    MAX_NEARBY_RADIUS,
+)
+from sqlalchemy.orm import relationship, validates, joinedload
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy import ForeignKey
+import hashlib
 import uuid
 import re
 
@@ -19,6 +30,123 @@ def generate_id() -> str:
     return re.sub("-", "", str(uuid.uuid4()))
 
 
+def hash_description(description: str) -> str:
+    """
+    Generate the content hash of an event description.
+
+    The description is lowercased and its whitespace collapsed before
+    hashing so descriptions that only differ in case or spacing
+    are considered duplicates
+
+    Args:
+        description: the event description
+
+    Returns:
+        str: the sha256 hex digest of the normalized description
+    """
+    normalized = " ".join(description.lower().split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def default_description_hash(context) -> str:
+    """
+    Generate the description hash of an event inserted without one.
+
+    Args:
+        context: the execution context of the insert
+
+    Returns:
+        str: the content hash of the inserted description
+    """
+    return hash_description(context.get_current_parameters()["description"])
+
+
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP"}
+CURRENCY_CODES = {"usd", "eur", "gbp", "cad"}
+
+
+def parse_cost(cost: str) -> tuple:
+    """
+    Parse the free form cost of an event.
+
+    "free" is a cost of 0, otherwise the first amount in the text is used,
+    so a range like "$10 - $20" is parsed as its lowest price.
+    Amounts without a currency are considered USD
+
+    Args:
+        cost: the cost of the event as entered by the user
+
+    Returns:
+        tuple: the cost in cents and the currency code,
+        (None, None) if the cost has no amount
+    """
+    text = cost.strip().lower()
+
+    if "free" in text:
+        return 0, None
+
+    amount = re.search(r"\d+(?:\.\d+)?", re.sub(r"(?<=\d),(?=\d{3})", "", text))
+
+    if not amount:
+        return None, None
+
+    currency = next(
+        (code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in text),
+        next(
+            (
+                code.upper()
+                for code in re.findall(r"[a-z]{3}", text)
+                if code in CURRENCY_CODES
+            ),
+            "USD",
+        ),
+    )
+    return round(float(amount.group()) * 100), currency
+
+
+def default_cost_cents(context) -> int:
+    """
+    Generate the cost in cents of an event inserted without one.
+
+    Args:
+        context: the execution context of the insert
+
+    Returns:
+        int: the parsed cost in cents
+    """
+    return parse_cost(context.get_current_parameters()["cost"])[0]
+
+
+def default_cost_currency(context) -> str:
+    """
+    Generate the cost currency of an event inserted without one.
+
+    Args:
+        context: the execution context of the insert
+
+    Returns:
+        str: the parsed currency code
+    """
+    return parse_cost(context.get_current_parameters()["cost"])[1]
+
+
+def required_columns(model: db.Model) -> list:
+    """
+    Get the columns of a table that must be provided on insert.
+
+    Args:
+        model: the model of the table
+
+    Returns:
+        the names of the non nullable columns without a default
+    """
+    return [
+        column.name
+        for column in model.__table__.columns
+        if not column.nullable and column.default is None
+    ]
+
+
 class UserRole(db.Model):
     """
     Class that represents the user role table.
@@ -60,6 +188,7 @@ class User(db.Model):
             user_role_id: the id of the role associated with the user
             password: the hashed password of the user
             canceled: 1 if canceled 0 if not
+            role_name: the name of the role associated with the user
     """
 
     id = db.Column(db.String, primary_key=True, default=generate_id)
@@ -71,6 +200,20 @@ class User(db.Model):
     canceled = db.Column(db.Integer, nullable=False, default=0)
 
     user_role = relationship(UserRole)
+    role_name = association_proxy("user_role", "role_name")
+
+
+def with_role():
+    """
+    Get the query option that loads the role of users in the same query.
+
+    The join is an outer join, user_role_id is not checked when a user
+    is created so a user can reference a missing role
+
+    Returns:
+        a joined load of the user role
+    """
+    return joinedload(User.user_role)
 
 
 class UserInputSchema(ma.Schema):
@@ -121,6 +264,15 @@ class Event(db.Model):
             create_user_id: the id of the user that created the event
             update_time: the last time of update associated with the event row
             canceled: 1 if canceled 0 if not
+            description_hash: the unique content hash of the description
+            cost_cents: the cost parsed in cents, 0 if free, None if unknown
+            cost_currency: the currency code of the parsed cost
+            latitude: the optional latitude of the event location
+            longitude: the optional longitude of the event location
+            change_seq: the position of the last change of the event in the sequence
+            version: the number of times the event was changed, used as its ETag
+            capacity: the optional number of seats, registrations past it are waitlisted
+            registered: the number of seated registrations
     """
 
     id = db.Column(db.String, primary_key=True, default=generate_id)
@@ -134,9 +286,53 @@ class Event(db.Model):
     create_user_id = db.Column(db.String, ForeignKey(User.id), nullable=False)
     update_time = db.Column(db.String, nullable=False)
     canceled = db.Column(db.Integer, nullable=False, default=0)
+    description_hash = db.Column(
+        db.String,
+        nullable=False,
+        unique=True,
+        index=True,
+        default=default_description_hash,
+    )
+    cost_cents = db.Column(db.Integer, nullable=True, default=default_cost_cents)
+    cost_currency = db.Column(db.String, nullable=True, default=default_cost_currency)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    change_seq = db.Column(db.Integer, nullable=True, unique=True, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    capacity = db.Column(db.Integer, nullable=True)
+    registered = db.Column(db.Integer, nullable=False, default=0)
 
     user = relationship(User)
 
+    __table_args__ = (
+        db.Index("ix_event_canceled_start_time", canceled, start_time),
+        db.Index(
+            "ix_event_canceled_category_start_time", canceled, category, start_time
+        ),
+        db.Index(
+            "ix_event_location_canceled_start_time", location, canceled, start_time
+        ),
+        db.Index(
+            "ix_event_create_user_id_canceled_start_time",
+            create_user_id,
+            canceled,
+            start_time,
+        ),
+        db.Index("ix_event_canceled_cost_cents", canceled, cost_cents),
+    )
+
+    @validates("description")
+    def validate_description(self, key: str, description: str) -> str:
+        """Keep the description hash in sync with the description."""
+        self.description_hash = hash_description(description)
+        return description
+
+    @validates("cost")
+    def validate_cost(self, key: str, cost: str) -> str:
+        """Keep the parsed cost in sync with the cost."""
+        self.cost_cents, self.cost_currency = parse_cost(cost)
+        return cost
+
 
 class EventSchema(ma.Schema):
     """
@@ -146,6 +342,12 @@ class EventSchema(ma.Schema):
         and for validating the data from event requests
     """
 
+    latitude = fields.Float(allow_none=True, validate=validate.Range(min=-90, max=90))
+    longitude = fields.Float(
+        allow_none=True, validate=validate.Range(min=-180, max=180)
+    )
+    capacity = fields.Integer(allow_none=True, validate=validate.Range(min=0))
+
     class Meta:
         fields = (
             "id",
@@ -158,6 +360,9 @@ class EventSchema(ma.Schema):
             "event_link",
             "create_user_id",
             "update_time",
+            "latitude",
+            "longitude",
+            "capacity",
         )
 
 
@@ -173,6 +378,12 @@ class EventUpdateFormSchema(ma.Schema):
         and for validating the data from event update requests
     """
 
+    latitude = fields.Float(allow_none=True, validate=validate.Range(min=-90, max=90))
+    longitude = fields.Float(
+        allow_none=True, validate=validate.Range(min=-180, max=180)
+    )
+    capacity = fields.Integer(allow_none=True, validate=validate.Range(min=0))
+
     class Meta:
         fields = (
             "user_id",
@@ -184,6 +395,9 @@ class EventUpdateFormSchema(ma.Schema):
             "end_time",
             "event_link",
             "update_time",
+            "latitude",
+            "longitude",
+            "capacity",
         )
 
 
@@ -199,16 +413,25 @@ class EventRegistration(db.Model):
             event_id: the id of the event the user is being registered to
             user_id: the id of the user that is registering to the event
             canceled: 1 if canceled 0 if not
+            waitlisted: the position of the user on the waitlist, None if seated
     """
 
     id = db.Column(db.String, primary_key=True, default=generate_id)
     event_id = db.Column(db.String, ForeignKey(Event.id), nullable=False)
     user_id = db.Column(db.String, ForeignKey(User.id), nullable=False)
     canceled = db.Column(db.Integer, nullable=False, default=0)
+    waitlisted = db.Column(db.Integer, nullable=True)
 
     event = relationship(Event)
     user = relationship(User)
 
+    __table_args__ = (
+        db.Index(
+            "ix_event_registration_event_id_user_id", event_id, user_id, unique=True
+        ),
+        db.Index("ix_event_registration_event_id_waitlisted", event_id, waitlisted),
+    )
+
 
 class EventRegistrationSchema(ma.Schema):
     """
@@ -219,7 +442,7 @@ class EventRegistrationSchema(ma.Schema):
     """
 
     class Meta:
-        fields = ("id", "event_id", "user_id")
+        fields = ("id", "event_id", "user_id", "waitlisted")
 
 
 event_registration_schema = EventRegistrationSchema()
@@ -245,6 +468,10 @@ class EventFavorite(db.Model):
     event = relationship(Event)
     user = relationship(User)
 
+    __table_args__ = (
+        db.Index("ix_event_favorite_event_id_user_id", event_id, user_id, unique=True),
+    )
+
 
 class EventFavoriteSchema(ma.Schema):
     """
@@ -262,6 +489,37 @@ event_favorite_schema = EventFavoriteSchema()
 event_favorites_schema = EventFavoriteSchema(many=True)
 
 
+class EventUserBatchSchema(ma.Schema):
+    """
+    Class that represents the event user batch schema.
+
+        Used for validating the data from requests that register,
+        favorite or remove a user for many events at once,
+        the user_id is not required with an access token
+    """
+
+    user_id = fields.String()
+    event_ids = fields.List(fields.String(), required=True)
+
+
+event_user_batch_schema = EventUserBatchSchema()
+
+
+class EventBulkRemoveSchema(ma.Schema):
+    """
+    Class that represents the event bulk remove schema.
+
+        Used for validating the data from requests that delete
+        many events at once
+    """
+
+    event_ids = fields.List(fields.String(), required=True)
+    requester_id = fields.String()
+
+
+event_bulk_remove_schema = EventBulkRemoveSchema()
+
+
 class EventShare(db.Model):
     """
     Class that represents the event share table.
@@ -296,4 +554,114 @@ event_share_schema = EventShareSchema()
 event_shares_schema = EventShareSchema(many=True)
 
 
+class EventSearchSchema(ma.Schema):
+    """
+    Class that represents the event search schema.
+
+        Used for validating the query string of event search requests
+    """
+
+    q = fields.String(required=True, validate=validate.Length(min=1))
+    page = fields.Integer(load_default=1, validate=validate.Range(min=1))
+    per_page = fields.Integer(
+        load_default=DEFAULT_PAGE_SIZE,
+        validate=validate.Range(min=1, max=MAX_PAGE_SIZE),
+    )
+
+
+event_search_schema = EventSearchSchema()
+
+
+class EventFilterSchema(ma.Schema):
+    """
+    Class that represents the event filter schema.
+
+        Used for validating the query string of event list requests,
+        unknown parameters are ignored
+    """
+
+    class Meta:
+        unknown = EXCLUDE
+
+    category = fields.String()
+    location = fields.String()
+    creator = fields.String()
+    min_cost = fields.Float(validate=validate.Range(min=0))
+    max_cost = fields.Float(validate=validate.Range(min=0))
+    sort = fields.String(
+        load_default="start_time", validate=validate.OneOf(["start_time", "cost"])
+    )
+    start_from = fields.String(data_key="from")
+    start_to = fields.String(data_key="to")
+
+
+event_filter_schema = EventFilterSchema()
+
+
+class EventCategoryFilterSchema(ma.Schema):
+    """
+    Class that represents the event category filter schema.
+
+        Used for validating the query string of event category requests,
+        unknown parameters are ignored
+    """
+
+    class Meta:
+        unknown = EXCLUDE
+
+    start_from = fields.String(data_key="from")
+    start_to = fields.String(data_key="to")
+
+
+event_category_filter_schema = EventCategoryFilterSchema()
+
+
+class EventNearbySchema(ma.Schema):
+    """
+    Class that represents the event nearby schema.
+
+        Used for validating the query string of nearby event requests,
+        the radius is in kilometers
+    """
+
+    latitude = fields.Float(
+        data_key="lat", required=True, validate=validate.Range(min=-90, max=90)
+    )
+    longitude = fields.Float(
+        data_key="lon", required=True, validate=validate.Range(min=-180, max=180)
+    )
+    radius = fields.Float(
+        load_default=DEFAULT_NEARBY_RADIUS,
+        validate=validate.Range(min=0, max=MAX_NEARBY_RADIUS, min_inclusive=False),
+    )
+    per_page = fields.Integer(
+        load_default=DEFAULT_PAGE_SIZE,
+        validate=validate.Range(min=1, max=MAX_PAGE_SIZE),
+    )
+
+
+event_nearby_schema = EventNearbySchema()
+
+
+class EventChangesSchema(ma.Schema):
+    """
+    Class that represents the event changes schema.
+
+        Used for validating the query string of event change requests,
+        since is the cursor returned by the previous request
+    """
+
+    since = fields.Integer(load_default=0, validate=validate.Range(min=0))
+    per_page = fields.Integer(
+        load_default=DEFAULT_CHANGES_PAGE_SIZE,
+        validate=validate.Range(min=1, max=MAX_CHANGES_PAGE_SIZE),
+    )
+
+
+event_changes_schema = EventChangesSchema()
+
+
+from api.migrations import upgrade_schema
+
 db.create_all()
+upgrade_schema()
@@ -0,0 +1,159 @@
+import os
+import re
+import sys
+import time
+from collections import Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from api import app, QUERY_PROFILE, SLOW_QUERY_MS, REPEATED_QUERY_LIMIT
+
+
+API_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PROFILE_HEADER = "X-Query-Profile"
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Get the shape of a SQL statement.
+
+    Literals are replaced with placeholders and lists of placeholders
+    are collapsed, so the same query run with different values,
+    like the queries of an N+1 loop, has the same shape
+
+    Args:
+        statement: the SQL statement
+
+    Returns:
+        the normalized statement
+    """
+    shape = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    shape = re.sub(r"\b\d+(?:\.\d+)?\b", "?", shape)
+    shape = re.sub(r"\?(?:\s*,\s*\?)+", "?...", shape)
+    return " ".join(shape.split())
+
+
+def call_site() -> str:
+    """
+    Get the application code that executed the current SQL statement.
+
+    Returns:
+        the file, line and function of the closest api frame
+    """
+    frame = sys._getframe(1)
+
+    while frame:
+        filename = frame.f_code.co_filename
+
+        if filename.startswith(API_DIRECTORY) and filename != __file__:
+            return (
+                f"{os.path.basename(filename)}:{frame.f_lineno} "
+                f"in {frame.f_code.co_name}"
+            )
+
+        frame = frame.f_back
+
+    return "unknown"
+
+
+class QueryProfile:
+    """
+    Class that represents the SQL statements executed by a request.
+
+        Attributes:
+            queries: the shape, duration in milliseconds and call site of each statement
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def add(self, statement: str, duration: float):
+        """Record an executed statement and its duration in milliseconds."""
+        self.queries.append((statement_shape(statement), duration, call_site()))
+
+    def slow(self) -> list:
+        """Get the statements that took longer than the slow query threshold."""
+        return [query for query in self.queries if query[1] >= SLOW_QUERY_MS]
+
+    def repeated(self) -> list:
+        """
+        Get the statement shapes executed too many times, a sign of an N+1.
+
+        Returns:
+            the shape, count and first call site of each repeated statement
+        """
+        counts = Counter(shape for shape, _, _ in self.queries)
+        sites = {}
+
+        for shape, _, site in self.queries:
+            sites.setdefault(shape, site)
+
+        return [
+            (shape, count, sites[shape])
+            for shape, count in counts.items()
+            if count >= REPEATED_QUERY_LIMIT
+        ]
+
+    def summary(self) -> str:
+        """Get a one line summary of the profile."""
+        duration = sum(query[1] for query in self.queries)
+        return (
+            f"queries={len(self.queries)}; time_ms={duration:.2f}; "
+            f"slow={len(self.slow())}; repeated={len(self.repeated())}"
+        )
+
+
+def profile_enabled(output: str) -> bool:
+    """Check if the profile is reported with the given output, header or log."""
+    return output in (QUERY_PROFILE or "").split(",")
+
+
+def start_query(conn, cursor, statement, parameters, context, executemany):
+    """Record the start time of a SQL statement."""
+    conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def end_query(conn, cursor, statement, parameters, context, executemany):
+    """Add a SQL statement to the profile of the current request."""
+    duration = (time.perf_counter() - conn.info["profile_start"].pop()) * 1000
+
+    if has_request_context() and "query_profile" in g:
+        g.query_profile.add(statement, duration)
+
+
+def start_profile():
+    """Start the SQL profile of a request."""
+    g.query_profile = QueryProfile()
+
+
+def report_profile(response):
+    """Report the SQL profile of a request in a header and/or the log."""
+    profile = g.pop("query_profile", None)
+
+    if not profile:
+        return response
+
+    if profile_enabled("header"):
+        response.headers[PROFILE_HEADER] = profile.summary()
+
+    if profile_enabled("log"):
+        endpoint = request.endpoint or "unmatched"
+        slow = profile.slow()
+        repeated = profile.repeated()
+        log = app.logger.warning if slow or repeated else app.logger.info
+        log("query profile %s: %s", endpoint, profile.summary())
+
+        for shape, duration, site in slow:
+            app.logger.warning("slow query %.2fms at %s: %s", duration, site, shape)
+
+        for shape, count, site in repeated:
+            app.logger.warning("repeated query x%d at %s: %s", count, site, shape)
+
+    return response
+
+
+if QUERY_PROFILE:
+    event.listen(Engine, "before_cursor_execute", start_query)
+    event.listen(Engine, "after_cursor_execute", end_query)
+    app.before_request(start_profile)
+    app.after_request(report_profile)
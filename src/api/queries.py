@@ -0,0 +1,804 @@
+import math
+import re
+from sqlalchemy import bindparam, text, func
+from typing import Optional
+from api import db, ADMIN_ROLE_UUID, USER_ROLE_UUID
+from api.cache import Cache
+from api.constants import ROLE_CACHE_TTL, USER_ROLE_CACHE_SIZE
+from api.models import (
+    Event,
+    EventRegistration,
+    User,
+    generate_id,
+    hash_description,
+    parse_cost,
+)
+
+
+EVENT_COLUMNS = ", ".join(column.name for column in Event.__table__.columns)
+
+user_role_cache = Cache(ttl=ROLE_CACHE_TTL, size=USER_ROLE_CACHE_SIZE)
+
+
+def get_user_role_id(user_id: str) -> Optional[str]:
+    """
+    Get the role of an active user.
+
+    Roles are cached so authorization checks do not query the database,
+    the cached role of a user must be discarded when the user changes
+
+    Args:
+        user_id: the id of the user
+
+    Returns:
+        the id of the role of the user, None if the user does not exist
+    """
+    return user_role_cache.get(
+        user_id,
+        lambda: db.session.query(User.user_role_id)
+        .filter_by(id=user_id, canceled=0)
+        .scalar(),
+    )
+
+
+def is_admin(user_id: str) -> bool:
+    """Check if a user is an active ADMIN."""
+    return get_user_role_id(user_id) == ADMIN_ROLE_UUID
+
+
+def activate_event_user(model: db.Model, event_id: str, user_id: str):
+    """
+    Create or reactivate the row of a user to event table.
+
+    A single INSERT ... ON CONFLICT statement is used so concurrent
+    requests for the same event and user can not create duplicate rows
+
+    Args:
+        model: EventRegistration or EventFavorite
+        event_id: the id of the event
+        user_id: the id of the user
+
+    Returns:
+        the id, event_id and user_id of the active row
+    """
+    return db.session.execute(
+        text(
+            f"""
+            INSERT INTO {model.__tablename__} (id, event_id, user_id, canceled)
+            VALUES (:id, :event_id, :user_id, 0)
+            ON CONFLICT (event_id, user_id) DO UPDATE SET canceled = 0
+            RETURNING id, event_id, user_id
+            """
+        ),
+        {"id": generate_id(), "event_id": event_id, "user_id": user_id},
+    ).first()
+
+
+def cancel_event_user(model: db.Model, event_id: str, user_id: str):
+    """
+    Cancel the row of a user to event table.
+
+    Args:
+        model: EventRegistration or EventFavorite
+        event_id: the id of the event
+        user_id: the id of the user
+
+    Returns:
+        the id, event_id and user_id of the canceled row, None if there is no row
+    """
+    return db.session.execute(
+        text(
+            f"""
+            UPDATE {model.__tablename__} SET canceled = 1
+            WHERE event_id = :event_id AND user_id = :user_id
+            RETURNING id, event_id, user_id
+            """
+        ),
+        {"event_id": event_id, "user_id": user_id},
+    ).first()
+
+
+def insert_user(user: dict):
+    """
+    Create a user.
+
+    The role name is returned by the INSERT so the created user
+    does not have to be loaded again to build the response
+
+    Args:
+        user: the username, hashed password and optional id and user_role_id
+
+    Returns:
+        the id, username, user_role_id and role_name of the user,
+        None if the username exists
+    """
+    return db.session.execute(
+        text(
+            """
+            INSERT INTO "user" (id, username, user_role_id, password, canceled)
+            VALUES (:id, :username, :user_role_id, :password, 0)
+            ON CONFLICT (username) DO NOTHING
+            RETURNING id, username, user_role_id, (
+                SELECT role_name FROM user_role WHERE user_role.id = "user".user_role_id
+            ) AS role_name
+            """
+        ),
+        {
+            "id": user.get("id") or generate_id(),
+            "user_role_id": user.get("user_role_id") or USER_ROLE_UUID,
+            "username": user["username"],
+            "password": user["password"],
+        },
+    ).first()
+
+
+def get_event_registration(event_id: str, user_id: str):
+    """
+    Get the registration of a user to an event.
+
+    Args:
+        event_id: the id of the event
+        user_id: the id of the user
+
+    Returns:
+        the id, event_id, user_id and waitlisted of the registration,
+        None if there is none
+    """
+    return db.session.execute(
+        text(
+            """
+            SELECT id, event_id, user_id, waitlisted FROM event_registration
+            WHERE event_id = :event_id AND user_id = :user_id
+            """
+        ),
+        {"event_id": event_id, "user_id": user_id},
+    ).first()
+
+
+def register_event_user(event_id: str, user_id: str):
+    """
+    Register a user to an event, or add them to its waitlist when it is full.
+
+    A seat is taken with a conditional UPDATE of the registered counter
+    of the event instead of counting the registrations before inserting.
+    SQLite has a single writer and the UPDATE checks the counter it
+    increments, so concurrent workers can not take more seats than the
+    capacity. A user that gets no seat is given the next waitlist position.
+    Events that do not exist or are canceled can not be registered to
+
+    Args:
+        event_id: the id of the event
+        user_id: the id of the user
+
+    Returns:
+        the id, event_id, user_id and waitlisted of the registration,
+        None if the event is not active
+    """
+    parameters = {"id": generate_id(), "event_id": event_id, "user_id": user_id}
+    seated = db.session.execute(
+        text(
+            """
+            UPDATE event SET registered = registered + 1
+            WHERE id = :event_id AND canceled = 0
+            AND (capacity IS NULL OR registered < capacity)
+            AND NOT EXISTS (
+                SELECT 1 FROM event_registration
+                WHERE event_id = :event_id AND user_id = :user_id AND canceled = 0
+            )
+            """
+        ),
+        parameters,
+    ).rowcount
+    registration = db.session.execute(
+        text(
+            """
+            INSERT INTO event_registration (id, event_id, user_id, canceled, waitlisted)
+            SELECT :id, :event_id, :user_id, 0, CASE
+                WHEN :seated OR capacity IS NULL THEN NULL
+                ELSE (
+                    SELECT IFNULL(MAX(waitlisted), 0) + 1 FROM event_registration
+                    WHERE event_id = :event_id
+                )
+            END
+            FROM event WHERE id = :event_id AND canceled = 0
+            ON CONFLICT (event_id, user_id) DO UPDATE
+            SET canceled = 0, waitlisted = excluded.waitlisted WHERE canceled = 1
+            RETURNING id, event_id, user_id, waitlisted
+            """
+        ),
+        {**parameters, "seated": seated},
+    ).first()
+
+    if registration:
+        return registration
+
+    # The user already had an active registration, it is left unchanged
+    return db.session.execute(
+        text(
+            """
+            SELECT r.id, r.event_id, r.user_id, r.waitlisted
+            FROM event_registration r JOIN event e ON e.id = r.event_id
+            WHERE r.event_id = :event_id AND r.user_id = :user_id AND e.canceled = 0
+            """
+        ),
+        parameters,
+    ).first()
+
+
+def promote_waitlist(event_id: str) -> int:
+    """
+    Give the free seats of an event to the first users of its waitlist.
+
+    Args:
+        event_id: the id of the event
+
+    Returns:
+        the number of promoted users
+    """
+    promoted = db.session.execute(
+        text(
+            """
+            UPDATE event_registration SET waitlisted = NULL
+            WHERE id IN (
+                SELECT id FROM event_registration
+                WHERE event_id = :event_id AND canceled = 0 AND waitlisted IS NOT NULL
+                ORDER BY waitlisted
+                LIMIT IFNULL((
+                    SELECT MAX(capacity - registered, 0) FROM event WHERE id = :event_id
+                ), -1)
+            )
+            """
+        ),
+        {"event_id": event_id},
+    ).rowcount
+
+    if promoted:
+        db.session.execute(
+            text(
+                "UPDATE event SET registered = registered + :promoted "
+                "WHERE id = :event_id"
+            ),
+            {"event_id": event_id, "promoted": promoted},
+        )
+
+    return promoted
+
+
+def unregister_event_user(event_id: str, user_id: str):
+    """
+    Cancel the registration of a user to an event.
+
+    The seat of a seated user is given to the first user of the waitlist
+
+    Args:
+        event_id: the id of the event
+        user_id: the id of the user
+
+    Returns:
+        the id, event_id, user_id and waitlisted of the registration,
+        None if there is none
+    """
+    registration = db.session.execute(
+        text(
+            """
+            UPDATE event_registration SET canceled = 1
+            WHERE event_id = :event_id AND user_id = :user_id AND canceled = 0
+            RETURNING id, event_id, user_id, waitlisted
+            """
+        ),
+        {"event_id": event_id, "user_id": user_id},
+    ).first()
+
+    if not registration:
+        return get_event_registration(event_id, user_id)
+
+    if registration.waitlisted is None:
+        db.session.execute(
+            text("UPDATE event SET registered = registered - 1 WHERE id = :event_id"),
+            {"event_id": event_id},
+        )
+        promote_waitlist(event_id)
+
+    return registration
+
+
+def cancel_user(user_id: str):
+    """
+    Cancel an active user.
+
+    Args:
+        user_id: the id of the user
+
+    Returns:
+        the id, username, user_role_id and role_name of the user,
+        None if there is no active user
+    """
+    return db.session.execute(
+        text(
+            """
+            UPDATE "user" SET canceled = 1 WHERE id = :user_id AND canceled = 0
+            RETURNING id, username, user_role_id, (
+                SELECT role_name FROM user_role WHERE user_role.id = "user".user_role_id
+            ) AS role_name
+            """
+        ),
+        {"user_id": user_id},
+    ).first()
+
+
+def cancel_events(event_ids: list, requester_id: str, admin: bool) -> list:
+    """
+    Cancel the active events a requester is allowed to cancel.
+
+    A single conditional UPDATE checks the permission and cancels the events,
+    the creator of an event or an ADMIN can cancel it. Events that are
+    already canceled are left unchanged so they are not published again
+
+    Args:
+        event_ids: the ids of the events
+        requester_id: the id of the user canceling the events
+        admin: True if the requester is an ADMIN
+
+    Returns:
+        the canceled events
+    """
+    return db.session.execute(
+        text(
+            f"""
+            UPDATE event SET canceled = 1, version = version + 1
+            WHERE id IN :event_ids AND canceled = 0
+            AND (:admin OR create_user_id = :requester_id)
+            RETURNING {EVENT_COLUMNS}
+            """
+        ).bindparams(bindparam("event_ids", expanding=True)),
+        {"event_ids": event_ids, "requester_id": requester_id, "admin": admin},
+    ).fetchall()
+
+
+def insert_events(events: list) -> set:
+    """
+    Create events, skipping the events that conflict with an existing row.
+
+    The events are inserted with a single INSERT OR IGNORE executemany so
+    an id or description hash created by a concurrent request only skips
+    its own event. The write lock is taken first, the rows after the
+    largest rowid are then the created events
+
+    Args:
+        events: the column values of each event
+
+    Returns:
+        the ids of the created events
+    """
+    if not events:
+        return set()
+
+    # pysqlite only opens the transaction before a data change
+    db.session.execute(text("DELETE FROM event WHERE 0"))
+    after = db.session.execute(text("SELECT IFNULL(MAX(rowid), 0) FROM event")).scalar()
+    db.session.execute(Event.__table__.insert().prefix_with("OR IGNORE"), events)
+
+    return {
+        id
+        for (id,) in db.session.execute(
+            text("SELECT id FROM event WHERE rowid > :after"), {"after": after}
+        )
+    }
+
+
+def update_event_columns(
+    event_id: str, user_id: str, values: dict, versions: Optional[list] = None
+):
+    """
+    Update the columns of an active event created by a user.
+
+    A single conditional UPDATE checks the creator and the version and updates
+    the event, so a concurrent update between reading the event and updating
+    it is detected without locking. The description hash and parsed cost are
+    updated with their columns and the version is incremented
+
+    Args:
+        event_id: the id of the event
+        user_id: the id of the user updating the event
+        values: the new value of each updated column
+        versions: the versions the event is expected to have, None for any
+
+    Returns:
+        the updated event, None if there is no active event created by the user
+        with one of the versions
+    """
+    values = dict(values)
+
+    if "description" in values:
+        values["description_hash"] = hash_description(values["description"])
+
+    if "cost" in values:
+        values["cost_cents"], values["cost_currency"] = parse_cost(values["cost"])
+
+    columns = "".join(f"{column} = :{column}, " for column in values)
+    statement = text(
+        f"""
+        UPDATE event SET {columns}version = version + 1
+        WHERE id = :event_id AND create_user_id = :user_id AND canceled = 0
+        AND (:any_version OR version IN :versions)
+        RETURNING {EVENT_COLUMNS}
+        """
+    ).bindparams(bindparam("versions", expanding=True))
+    return db.session.execute(
+        statement,
+        {
+            **values,
+            "event_id": event_id,
+            "user_id": user_id,
+            "any_version": versions is None,
+            "versions": versions or [0],
+        },
+    ).first()
+
+
+def existing_events(event_ids: list) -> set:
+    """Get the ids of the active events among the given ids."""
+    return {
+        id
+        for (id,) in db.session.query(Event.id).filter(
+            Event.id.in_(event_ids), Event.canceled == 0
+        )
+    }
+
+
+def activate_event_users(model: db.Model, event_ids: list, user_id: str):
+    """
+    Create or reactivate the rows of a user to event table for many events.
+
+    Args:
+        model: EventRegistration or EventFavorite
+        event_ids: the ids of the events
+        user_id: the id of the user
+    """
+    if not event_ids:
+        return
+
+    db.session.execute(
+        text(
+            f"""
+            INSERT INTO {model.__tablename__} (id, event_id, user_id, canceled)
+            VALUES (:id, :event_id, :user_id, 0)
+            ON CONFLICT (event_id, user_id) DO UPDATE SET canceled = 0
+            """
+        ),
+        [
+            {"id": generate_id(), "event_id": event_id, "user_id": user_id}
+            for event_id in event_ids
+        ],
+    )
+
+
+def cancel_event_users(model: db.Model, event_ids: list, user_id: str):
+    """
+    Cancel the rows of a user to event table for many events.
+
+    Args:
+        model: EventRegistration or EventFavorite
+        event_ids: the ids of the events
+        user_id: the id of the user
+    """
+    db.session.query(model).filter(
+        model.user_id == user_id, model.event_id.in_(event_ids)
+    ).update({model.canceled: 1}, synchronize_session=False)
+
+
+def get_event_users(model: db.Model, event_ids: list, user_id: str) -> dict:
+    """
+    Get the rows of a user to event table for many events.
+
+    Args:
+        model: EventRegistration or EventFavorite
+        event_ids: the ids of the events
+        user_id: the id of the user
+
+    Returns:
+        the id, event_id and user_id of the existing rows by event id
+    """
+    rows = (
+        db.session.query(model.id, model.event_id, model.user_id)
+        .filter(model.user_id == user_id, model.event_id.in_(event_ids))
+        .all()
+    )
+    return {row.event_id: row for row in rows}
+
+
+def change_event_users(
+    model: db.Model, event_ids: list, user_id: str, activate: bool
+) -> dict:
+    """
+    Create, reactivate or cancel the rows of a user to event table for many events.
+
+    Registrations take or free their seats one event at a time
+
+    Args:
+        model: EventRegistration or EventFavorite
+        event_ids: the ids of the events
+        user_id: the id of the user
+        activate: True to create or reactivate the rows, False to cancel them
+
+    Returns:
+        the existing rows by event id
+    """
+    if model is EventRegistration:
+        change = register_event_user if activate else unregister_event_user
+        rows = (change(event_id, user_id) for event_id in event_ids)
+        return {row.event_id: row for row in rows if row}
+
+    if activate:
+        activate_event_users(model, event_ids, user_id)
+    else:
+        cancel_event_users(model, event_ids, user_id)
+
+    return get_event_users(model, event_ids, user_id)
+
+
+def filter_events(filters: dict):
+    """
+    Build the query of the active events matching the given filters.
+
+    Every filter is optional and they are combined in a single query
+    ordered by start time or cost. Each of the category, location and
+    creator filters is served by an index that also covers the canceled
+    flag and the ordering, so selective filters never scan the event
+    table. Cost ranges and cost ordering use the parsed cost index
+
+    Args:
+        filters: the loaded event filter schema data
+
+    Returns:
+        the query of the matching events
+    """
+    query = db.session.query(Event).filter(Event.canceled == 0)
+
+    if "category" in filters:
+        query = query.filter(Event.category == filters["category"])
+
+    if "location" in filters:
+        query = query.filter(Event.location == filters["location"])
+
+    if "creator" in filters:
+        query = query.filter(Event.create_user_id == filters["creator"])
+
+    if "start_from" in filters:
+        query = query.filter(Event.start_time >= filters["start_from"])
+
+    if "start_to" in filters:
+        query = query.filter(Event.start_time <= filters["start_to"])
+
+    if "min_cost" in filters:
+        query = query.filter(Event.cost_cents >= round(filters["min_cost"] * 100))
+
+    if "max_cost" in filters:
+        query = query.filter(Event.cost_cents <= round(filters["max_cost"] * 100))
+
+    if filters.get("sort") == "cost":
+        return query.order_by(Event.cost_cents, Event.start_time)
+
+    return query.order_by(Event.start_time)
+
+
+def count_categories(filters: dict) -> list:
+    """
+    Count the active events of each category.
+
+    The count is a single GROUP BY over the category index,
+    which covers the canceled flag and the start time filters
+
+    Args:
+        filters: the loaded event category filter schema data
+
+    Returns:
+        the category and number of events of each category, ordered by category
+    """
+    query = db.session.query(Event.category, func.count()).filter(Event.canceled == 0)
+
+    if "start_from" in filters:
+        query = query.filter(Event.start_time >= filters["start_from"])
+
+    if "start_to" in filters:
+        query = query.filter(Event.start_time <= filters["start_to"])
+
+    rows = query.group_by(Event.category).order_by(Event.category).all()
+    return [{"category": category, "count": count} for category, count in rows]
+
+
+EARTH_RADIUS = 6371.0088
+
+
+def distance(latitude: float, longitude: float, event: Event) -> float:
+    """
+    Get the great circle distance between a point and an event.
+
+    Args:
+        latitude: the latitude of the point
+        longitude: the longitude of the point
+        event: an event with a latitude and longitude
+
+    Returns:
+        the haversine distance in kilometers
+    """
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    event_latitude = math.radians(event.latitude)
+    event_longitude = math.radians(event.longitude)
+    haversine = (
+        math.sin((event_latitude - latitude) / 2) ** 2
+        + math.cos(latitude)
+        * math.cos(event_latitude)
+        * math.sin((event_longitude - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1, math.sqrt(haversine)))
+
+
+def bounding_box(latitude: float, longitude: float, radius: float) -> dict:
+    """
+    Get the latitude and longitude bounds around a circle.
+
+    The box is slightly enlarged to cover the single precision rounding
+    of the R*Tree, and covers every longitude when the circle reaches
+    a pole or crosses the antimeridian
+
+    Args:
+        latitude: the latitude of the center
+        longitude: the longitude of the center
+        radius: the radius in kilometers
+
+    Returns:
+        the min_latitude, max_latitude, min_longitude and max_longitude
+    """
+    delta = math.degrees(radius / EARTH_RADIUS) + 1e-4
+    min_latitude, max_latitude = latitude - delta, latitude + delta
+
+    if min_latitude <= -90 or max_latitude >= 90:
+        return {
+            "min_latitude": max(min_latitude, -90),
+            "max_latitude": min(max_latitude, 90),
+            "min_longitude": -180,
+            "max_longitude": 180,
+        }
+
+    delta_longitude = delta / math.cos(math.radians(latitude))
+    min_longitude = longitude - delta_longitude
+    max_longitude = longitude + delta_longitude
+
+    if min_longitude < -180 or max_longitude > 180:
+        min_longitude, max_longitude = -180, 180
+
+    return {
+        "min_latitude": min_latitude,
+        "max_latitude": max_latitude,
+        "min_longitude": min_longitude,
+        "max_longitude": max_longitude,
+    }
+
+
+def nearby_events(latitude: float, longitude: float, radius: float, limit: int):
+    """
+    Get the active events within a distance of a point, closest first.
+
+    The R*Tree index selects the events inside the bounding box of the
+    circle, only those are loaded and ranked by their exact distance
+
+    Args:
+        latitude: the latitude of the point
+        longitude: the longitude of the point
+        radius: the maximum distance in kilometers
+        limit: the maximum number of events to return
+
+    Returns:
+        a list of events and their distance in kilometers
+    """
+    events = (
+        db.session.query(Event)
+        .from_statement(
+            text(
+                """
+                SELECT event.* FROM event_location
+                JOIN event ON event.rowid = event_location.id
+                WHERE event_location.max_latitude >= :min_latitude
+                AND event_location.min_latitude <= :max_latitude
+                AND event_location.max_longitude >= :min_longitude
+                AND event_location.min_longitude <= :max_longitude
+                AND event.canceled = 0
+                """
+            )
+        )
+        .params(**bounding_box(latitude, longitude, radius))
+        .all()
+    )
+    distances = [(event, distance(latitude, longitude, event)) for event in events]
+    nearby = [(event, km) for event, km in distances if km <= radius]
+    return sorted(nearby, key=lambda result: result[1])[:limit]
+
+
+def search_terms(query: str) -> str:
+    """
+    Turn a user query into an FTS5 match expression.
+
+    Every word of the query is quoted, so FTS5 operators typed by the
+    user are searched as text, and matched as a prefix so results
+    show up while the last word is still being typed
+
+    Args:
+        query: the text typed by the user
+
+    Returns:
+        the match expression, empty if the query has no words
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+
+def match_events(terms: str, limit: int, offset: int) -> list:
+    """
+    Get the active events matching a full text search, best match first.
+
+    Args:
+        terms: the FTS5 match expression
+        limit: the maximum number of events to return
+        offset: the number of events to skip
+
+    Returns:
+        the matching events ranked by BM25
+    """
+    return (
+        db.session.query(Event)
+        .from_statement(
+            text(
+                """
+                SELECT event.* FROM event_search
+                JOIN event ON event.rowid = event_search.rowid
+                WHERE event_search MATCH :terms AND event.canceled = 0
+                ORDER BY bm25(event_search)
+                LIMIT :limit OFFSET :offset
+                """
+            )
+        )
+        .params(terms=terms, limit=limit, offset=offset)
+        .all()
+    )
+
+
+def changed_events(since: int, limit: int) -> list:
+    """
+    Get the events changed after a position of the change sequence.
+
+    Args:
+        since: the change_seq of the last change already seen
+        limit: the maximum number of events to return
+
+    Returns:
+        the created, updated and canceled events in change order
+    """
+    return (
+        db.session.query(Event)
+        .filter(Event.change_seq > since)
+        .order_by(Event.change_seq)
+        .limit(limit)
+        .all()
+    )
+
+
+def archived_events(since: int, limit: int) -> list:
+    """
+    Get the events archived after a position of the change sequence.
+
+    Args:
+        since: the change_seq of the last change already seen
+        limit: the maximum number of events to return
+
+    Returns:
+        the id and change_seq of the archived events in change order
+    """
+    return db.session.execute(
+        text(
+            """
+            SELECT id, change_seq FROM archived_event
+            WHERE change_seq > :since ORDER BY change_seq LIMIT :limit
+            """
+        ),
+        {"since": since, "limit": limit},
+    ).fetchall()
@@ -1,22 +1,60 @@
 import json
+import queue
 import uuid
 import ssl
 import smtplib
 import urllib.parse
+from typing import Optional
 from email.message import EmailMessage
-from flask import jsonify, request
+from flask import g, jsonify, request, Response
 from api.models import *
-from api.decorators import one_result, valid_result
+from api.decorators import one_result, valid_result, signed_token
+from api.tokens import create_token
+from api.cache import Cache, event_cache, events_changed
+from api.broker import broker, publish_events, publish_metrics
+from api.coalescer import commit_write
+from api.metrics import observe, render
+from api.queries import (
+    user_role_cache,
+    is_admin,
+    activate_event_user,
+    cancel_event_user,
+    change_event_users,
+    filter_events,
+    count_categories,
+    nearby_events,
+    search_terms,
+    match_events,
+    changed_events,
+    archived_events,
+    cancel_user,
+    register_event_user,
+    unregister_event_user,
+    promote_waitlist,
+    insert_user,
+    cancel_events,
+    update_event_columns,
+    existing_events,
+    insert_events,
+)
 from api.constants import (
+    CATEGORY_CACHE_TTL,
+    CATEGORY_CACHE_SIZE,
+    MAX_BULK_EVENTS,
+    ROLE_CACHE_TTL,
+    STREAM_HEARTBEAT,
     NOT_FOUND_ERROR,
     CONTENT_TYPE,
     ALREADY_EXISTS_ERROR,
     LOGIN_ERROR,
+    PRECONDITION_FAILED_ERROR,
+    PRECONDITION_REQUIRED_ERROR,
     BAD_REQUEST_ERROR,
 )
 from api import (
     app,
     db,
+    ma,
     ADMIN_ROLE_UUID,
     EMAIL_USERNAME,
     EMAIL_PASSWORD,
@@ -24,7 +62,6 @@ from api import (
 )
 from sqlalchemy import func, and_
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from marshmallow import ValidationError
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
@@ -36,6 +73,20 @@ def check_active():
     return jsonify({"active": True})
 
 
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Get the request, database and operation metrics of every worker.
+
+    Returns:
+        the metrics in the Prometheus text format, status code, content type
+    """
+    return render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+role_cache = Cache(ttl=ROLE_CACHE_TTL)
+
+
 @app.route("/users/roles", methods=["GET"])
 def get_user_roles():
     """
@@ -44,8 +95,13 @@ def get_user_roles():
     Returns:
         a list of user role data, status code, content type
     """
-    user_roles = db.session.query(UserRole).filter(UserRole.canceled == 0).all()
-    return user_roles_schema.dump(user_roles), 200, CONTENT_TYPE
+    user_roles = role_cache.get(
+        "roles",
+        lambda: user_roles_schema.dump(
+            db.session.query(UserRole).filter(UserRole.canceled == 0).all()
+        ),
+    )
+    return user_roles, 200, CONTENT_TYPE
 
 
 @app.route("/users/roles", methods=["POST"])
@@ -80,6 +136,7 @@ def create_user_role():
     new_user_role = UserRole(**user_role)
     db.session.add(new_user_role)
     db.session.commit()
+    role_cache.clear()
     return user_role_schema.dump(new_user_role), 200, CONTENT_TYPE
 
 
@@ -91,26 +148,8 @@ def get_users():
     Returns:
         a list of user data, status code, content type
     """
-    users = (
-        db.session.query(User)
-        .join(UserRole, User.user_role_id == UserRole.id)
-        .add_entity(UserRole)
-        .filter(User.canceled == 0)
-        .all()
-    )
-    user_data = []
-
-    for user in users:
-        user_data.append(
-            {
-                "id": user[0].id,
-                "username": user[0].username,
-                "user_role_id": user[0].user_role_id,
-                "role_name": user[1].role_name,
-            }
-        )
-
-    return user_outputs_schema.dump(user_data), 200, CONTENT_TYPE
+    users = db.session.query(User).options(with_role()).filter(User.canceled == 0)
+    return user_outputs_schema.dump(users), 200, CONTENT_TYPE
 
 
 @app.route("/users/<id>", methods=["GET"])
@@ -125,7 +164,7 @@ def get_user(id: str):
     Returns:
         a list of user role data, status code, content type
     """
-    user = db.session.query(User).filter(User.id == id).one()
+    user = db.session.query(User).options(with_role()).filter(User.id == id).one()
     return user_output_schema.dump(user), 200, CONTENT_TYPE
 
 
@@ -161,16 +200,64 @@ def create_user():
         )
 
     ph = PasswordHasher()
-    user["password"] = ph.hash(user["password"])
 
-    new_user = User(**user)
-    db.session.add(new_user)
+    with observe("argon2_hash"):
+        user["password"] = ph.hash(user["password"])
+
+    new_user = insert_user(user)
     db.session.commit()
+
+    if not new_user:
+        error = ALREADY_EXISTS_ERROR["error"].format("User")
+        return jsonify({"error": error}), 200, CONTENT_TYPE
+
+    user_role_cache.discard(new_user.id)
     return user_output_schema.dump(new_user), 200, CONTENT_TYPE
 
 
+def requester_id() -> str:
+    """
+    Get the id of the user making a write request.
+
+    Returns:
+        the user of the access token, else the requester_id of the payload
+    """
+    return token_user_id(request.json, "requester_id")
+
+
+def token_user_id(payload: dict, key: str = "user_id") -> str:
+    """
+    Get the id of the user making a write request.
+
+    Args:
+        payload: the loaded payload of the request
+        key: the name of the user id in the payload
+
+    Returns:
+        the user of the access token, else the user id of the payload
+    """
+    return g.token["user_id"] if g.token else payload[key]
+
+
+def requester_is_admin() -> bool:
+    """
+    Check if the user making a write request is an ADMIN.
+
+    The role of an access token is trusted until the token expires,
+    without a token the role of the requester_id is looked up
+
+    Returns:
+        bool: True if the requester is an ADMIN
+    """
+    if g.token:
+        return g.token["role_id"] == ADMIN_ROLE_UUID
+
+    return is_admin(request.json["requester_id"])
+
+
 @app.route("/users", methods=["DELETE"])
 @valid_result
+@signed_token
 def delete_user():
     """
     Delete a user.
@@ -179,31 +266,28 @@ def delete_user():
 
     payload: json {
         "user_id": str,
-        "requester_id": str,
+        "requester_id": str, not required with an access token
     }
 
     Returns:
         the deleted user data, status code, content type
     """
 
-    user = db.session.query(User).filter_by(id=request.json["user_id"]).one_or_none()
+    if not requester_is_admin():
+        return (
+            jsonify({"error": BAD_REQUEST_ERROR}),
+            400,
+            CONTENT_TYPE,
+        )
 
-    requester = (
-        db.session.query(User)
-        .filter_by(id=request.json["requester_id"], user_role_id=ADMIN_ROLE_UUID)
-        .one_or_none()
-    )
+    user = cancel_user(request.json["user_id"])
+    db.session.commit()
 
-    if user and requester:
-        user.canceled = 1
-        db.session.commit()
-        return user_output_schema.dump(user), 200, CONTENT_TYPE
+    if not user:
+        return jsonify(NOT_FOUND_ERROR), 404, CONTENT_TYPE
 
-    return (
-        jsonify({"error": BAD_REQUEST_ERROR}),
-        400,
-        CONTENT_TYPE,
-    )
+    user_role_cache.discard(user.id)
+    return user_output_schema.dump(user), 200, CONTENT_TYPE
 
 
 @app.route("/users/login", methods=["POST"])
@@ -218,29 +302,39 @@ def user_login():
     }
 
     Returns:
-        logged in user data, status code, content type
+        logged in user data with an access token, status code, content type
     """
     ph = PasswordHasher()
-    default = ph.hash(str(uuid.uuid4()))
+
+    with observe("argon2_hash"):
+        default = ph.hash(str(uuid.uuid4()))
 
     user = user_input_schema.loads(json.dumps(request.json))
     user["username"] = user["username"].lower()
 
     login_user = (
         db.session.query(User)
+        .options(with_role())
         .filter_by(username=user["username"], canceled=0)
         .one_or_none()
     )
 
     if not login_user:
         try:
-            ph.verify(default, user["password"])
+            with observe("argon2_verify"):
+                ph.verify(default, user["password"])
         except VerifyMismatchError:
             return jsonify(LOGIN_ERROR), 400, CONTENT_TYPE
 
     try:
-        ph.verify(login_user.password, user["password"])
-        return user_output_schema.dump(login_user), 200, CONTENT_TYPE
+        with observe("argon2_verify"):
+            ph.verify(login_user.password, user["password"])
+        token = create_token(login_user.id, login_user.user_role_id)
+        return (
+            {**user_output_schema.dump(login_user), "token": token},
+            200,
+            CONTENT_TYPE,
+        )
     except VerifyMismatchError:
         return jsonify(LOGIN_ERROR), 400, CONTENT_TYPE
 
@@ -349,20 +443,218 @@ def get_user_suggestions(id: str):
 
 
 @app.route("/events", methods=["GET"])
+@valid_result
 def get_events():
     """
-    Get a list of all valid events.
+    Get a list of all valid events ordered by start time or cost.
+
+    query: {
+        "category": str,
+        "location": str,
+        "creator": str,
+        "min_cost": float,
+        "max_cost": float,
+        "from": str,
+        "to": str,
+        "sort": "start_time" | "cost",
+    }
 
     Returns:
         a list of event data, status code, content type
     """
-    events = db.session.query(Event).filter(Event.canceled == 0).all()
-    sorted_events = sorted(events, key=lambda event: event.start_time)
-    return events_schema.dump(sorted_events), 200, CONTENT_TYPE
+    filters = event_filter_schema.load(request.args)
+    events = filter_events(filters).all()
+    return events_schema.dump(events), 200, CONTENT_TYPE
+
+
+# The keys come from the date filters sent by clients, the size bounds how many are kept
+category_cache = event_cache(ttl=CATEGORY_CACHE_TTL, size=CATEGORY_CACHE_SIZE)
+
+
+@app.route("/events/categories", methods=["GET"])
+@valid_result
+def get_event_categories():
+    """
+    Get the categories of the valid events and the number of events in each.
+
+    The counts are cached until events change in this process, or for
+    a few seconds when they change in another process
+
+    query: {
+        "from": str,
+        "to": str,
+    }
+
+    Returns:
+        a list of category counts, status code, content type
+    """
+    filters = event_category_filter_schema.load(request.args)
+    key = (filters.get("start_from"), filters.get("start_to"))
+    categories = category_cache.get(key, lambda: count_categories(filters))
+    return jsonify(categories), 200, CONTENT_TYPE
+
+
+@app.route("/events/nearby", methods=["GET"])
+@valid_result
+def get_nearby_events():
+    """
+    Get the valid events within a radius of a location, closest first.
+
+    Only events with a latitude and longitude can be found
+
+    query: {
+        "lat": float,
+        "lon": float,
+        "radius": float,
+        "per_page": int,
+    }
+
+    Returns:
+        a list of event data with the distance in kilometers, status code, content type
+    """
+    nearby = event_nearby_schema.load(request.args)
+    events = nearby_events(
+        nearby["latitude"],
+        nearby["longitude"],
+        nearby["radius"],
+        limit=nearby["per_page"],
+    )
+    return (
+        jsonify(
+            [
+                {**event_schema.dump(event), "distance": round(km, 3)}
+                for event, km in events
+            ]
+        ),
+        200,
+        CONTENT_TYPE,
+    )
+
+
+@app.route("/events/search", methods=["GET"])
+@valid_result
+def search_events():
+    """
+    Search the active events by description, category and location.
+
+    query: {
+        "q": str,
+        "page": int,
+        "per_page": int,
+    }
+
+    Returns:
+        a page of event data ranked by relevance, status code, content type
+    """
+    search = event_search_schema.load(request.args)
+    terms = search_terms(search["q"])
+
+    if not terms:
+        return jsonify(BAD_REQUEST_ERROR), 400, CONTENT_TYPE
+
+    events = match_events(
+        terms,
+        limit=search["per_page"],
+        offset=(search["page"] - 1) * search["per_page"],
+    )
+    return events_schema.dump(events), 200, CONTENT_TYPE
+
+
+@app.route("/events/changes", methods=["GET"])
+@valid_result
+def get_event_changes():
+    """
+    Get the events changed since a cursor.
+
+    Clients keep the returned cursor and send it as since on their next
+    request to only receive what changed, the first request starts at 0.
+    Canceled and archived events are returned as deleted ids
+
+    query: {
+        "since": int,
+        "per_page": int,
+    }
+
+    Returns:
+        the changed events, deleted event ids, next cursor and if more changes
+        are available, status code, content type
+    """
+    changes = event_changes_schema.load(request.args)
+    since, per_page = changes["since"], changes["per_page"]
+    events = [
+        (event.change_seq, event) for event in changed_events(since, per_page + 1)
+    ]
+    archived = [
+        (change_seq, id) for id, change_seq in archived_events(since, per_page + 1)
+    ]
+    changed = sorted(events + archived, key=lambda change: change[0])
+    page = changed[:per_page]
+
+    return (
+        {
+            "events": events_schema.dump(
+                [
+                    event
+                    for _, event in page
+                    if isinstance(event, Event) and not event.canceled
+                ]
+            ),
+            "deleted": [
+                event.id if isinstance(event, Event) else event
+                for _, event in page
+                if not isinstance(event, Event) or event.canceled
+            ],
+            "cursor": page[-1][0] if page else since,
+            "more": len(changed) > len(page),
+        },
+        200,
+        CONTENT_TYPE,
+    )
+
+
+@app.route("/events/stream", methods=["GET"])
+def stream_events():
+    """
+    Stream the changes of the events as Server-Sent Events.
+
+    An event message is sent when an event is created, updated or canceled
+    and a metrics message when its registrations, favorites or shares change,
+    the data of each message is JSON with the type, id and action of the change.
+    A comment is sent when nothing changed for a while to keep the connection open
+
+    Returns:
+        the event stream, status code, headers
+    """
+
+    def stream():
+        # Subscribed once the response is read, a client that disconnects
+        # before never subscribes and its queue can not be left behind
+        subscriber = broker.subscribe()
+
+        try:
+            yield "retry: 3000\n\n"
+
+            while True:
+                try:
+                    message = subscriber.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return (
+        Response(stream(), mimetype="text/event-stream"),
+        200,
+        {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/events", methods=["POST"])
 @valid_result
+@signed_token
 def create_event():
     """
     Create an event.
@@ -375,7 +667,7 @@ def create_event():
         "start_time": str,
         "end_time": str,
         "event_link": str,
-        "create_user_id": str,
+        "create_user_id": str, not required with an access token
         "update_time": str,
     }
 
@@ -383,29 +675,152 @@ def create_event():
         created event data, status code, content type
     """
     event = event_schema.loads(json.dumps(request.json))
-    exists = (
-        db.session.query(Event.description)
-        .filter_by(description=event["description"])
-        .first()
-        is not None
-    )
+    event["create_user_id"] = token_user_id(event, "create_user_id")
+    error = ALREADY_EXISTS_ERROR["error"].format("Event")
+    new_event = Event(**event)
+    db.session.add(new_event)
 
-    if exists:
-        error = ALREADY_EXISTS_ERROR["error"].format("Event")
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
         return (
             jsonify({"error": error}),
             400,
             CONTENT_TYPE,
         )
 
-    new_event = Event(**event)
-    db.session.add(new_event)
-    db.session.commit()
+    events_changed()
+    publish_events("created", [new_event.id])
     return event_schema.dump(new_event), 200, CONTENT_TYPE
 
 
+@app.route("/events/bulk", methods=["POST"])
+@valid_result
+@signed_token
+def create_events():
+    """
+    Create a list of events.
+
+    Every event is validated and checked for duplicates before any of
+    them is created, and all the valid events are created in a single
+    transaction. An event is a duplicate if its normalized description
+    matches an existing event or an earlier event in the list, or if its
+    id or description was created by a concurrent request.
+    At most MAX_BULK_EVENTS events can be created by one request
+
+    payload: json [
+        {
+            "description": str,
+            "category": str,
+            "location": str,
+            "cost": str,
+            "start_time": str,
+            "end_time": str,
+            "event_link": str,
+            "create_user_id": str, not required with an access token
+            "update_time": str,
+        },
+    ]
+
+    Returns:
+        a list with the created event data or error of each event,
+        status code, content type
+    """
+    if not isinstance(request.json, list) or len(request.json) > MAX_BULK_EVENTS:
+        return jsonify(BAD_REQUEST_ERROR), 400, CONTENT_TYPE
+
+    required = required_columns(Event)
+    results = []
+    events = []
+
+    for event in request.json:
+        try:
+            event = event_schema.load(event)
+        except ValidationError:
+            event = None
+
+        if event and g.token:
+            event["create_user_id"] = g.token["user_id"]
+
+        if event and all(event.get(name) is not None for name in required):
+            events.append(event)
+            results.append(None)
+        else:
+            events.append(None)
+            results.append(BAD_REQUEST_ERROR)
+
+    hashes = [
+        hash_description(event["description"]) if event else None for event in events
+    ]
+    existing = {
+        result[0]
+        for result in db.session.query(Event.description_hash)
+        .filter(
+            Event.description_hash.in_(
+                [description_hash for description_hash in hashes if description_hash]
+            )
+        )
+        .all()
+    }
+    error = {"error": ALREADY_EXISTS_ERROR["error"].format("Event")}
+    new_events = []
+    positions = []
+
+    for index, event in enumerate(events):
+        if not event:
+            continue
+
+        if hashes[index] in existing:
+            results[index] = error
+            continue
+
+        existing.add(hashes[index])
+        event = {
+            "id": generate_id(),
+            "event_link": None,
+            "latitude": None,
+            "longitude": None,
+            "capacity": None,
+            "canceled": 0,
+            **event,
+        }
+        event["description_hash"] = hashes[index]
+        new_events.append(event)
+        positions.append(index)
+        results[index] = event
+
+    created = insert_events(new_events)
+    db.session.commit()
+
+    # Events whose id or description was created since the duplicate check,
+    # or whose id was taken by an earlier event of the list
+    for index, event in zip(positions, new_events):
+        if event["id"] in created:
+            created.discard(event["id"])
+        else:
+            results[index] = error
+
+    events_changed()
+    publish_events(
+        "created", [result["id"] for result in results if "error" not in result]
+    )
+
+    return (
+        jsonify(
+            [
+                result if "error" in result else event_schema.dump(result)
+                for result in results
+            ]
+        ),
+        200,
+        CONTENT_TYPE,
+    )
+
+
 @app.route("/events", methods=["DELETE"])
 @valid_result
+@signed_token
 def delete_event():
     """
     Delete an event.
@@ -414,33 +829,78 @@ def delete_event():
 
     payload: json {
         "event_id": str,
-        "requester_id": str,
+        "requester_id": str, not required with an access token
     }
 
     Returns:
         the deleted event data, status code, content type
     """
 
-    event = db.session.query(Event).filter_by(id=request.json["event_id"]).one_or_none()
+    event_id = request.json["event_id"]
+    events = cancel_events([event_id], requester_id(), requester_is_admin())
+    db.session.commit()
 
-    if event and request.json["requester_id"] == event.create_user_id:
-        requester = True
+    if not events:
+        if not existing_events([event_id]):
+            return jsonify(NOT_FOUND_ERROR), 404, CONTENT_TYPE
 
-    else:
-        requester = (
-            db.session.query(User)
-            .filter_by(id=request.json["requester_id"], user_role_id=ADMIN_ROLE_UUID)
-            .one_or_none()
+        return (
+            jsonify({"error": BAD_REQUEST_ERROR}),
+            400,
+            CONTENT_TYPE,
         )
 
-    if event and requester:
-        event.canceled = 1
-        db.session.commit()
-        return event_schema.dump(event), 200, CONTENT_TYPE
+    events_changed()
+    publish_events("canceled", [event_id])
+    return event_schema.dump(events[0]), 200, CONTENT_TYPE
+
+
+@app.route("/events/bulk/remove", methods=["POST"])
+@valid_result
+@signed_token
+def delete_events():
+    """
+    Delete many events.
+
+    The requester must either be the creator of each event or an ADMIN
+
+    payload: json {
+        "event_ids": [str],
+        "requester_id": str, not required with an access token
+    }
+
+    Returns:
+        the deleted event data of each event id, or an error if it was not
+        deleted, status code, content type
+    """
+    event_ids = list(
+        dict.fromkeys(event_bulk_remove_schema.load(request.json)["event_ids"])
+    )
+    events = {
+        event.id: event
+        for event in cancel_events(event_ids, requester_id(), requester_is_admin())
+    }
+    db.session.commit()
+
+    if events:
+        events_changed()
+        publish_events("canceled", list(events))
+
+    missing = [event_id for event_id in event_ids if event_id not in events]
+    existing = existing_events(missing) if missing else set()
 
     return (
-        jsonify({"error": BAD_REQUEST_ERROR}),
-        400,
+        jsonify(
+            [
+                event_schema.dump(events[event_id])
+                if event_id in events
+                else BAD_REQUEST_ERROR
+                if event_id in existing
+                else NOT_FOUND_ERROR
+                for event_id in event_ids
+            ]
+        ),
+        200,
         CONTENT_TYPE,
     )
 
@@ -458,22 +918,83 @@ def get_event(id: str):
         event data, status code, content type
     """
     event = db.session.query(Event).filter(Event.id == id).one()
-    return event_schema.dump(event), 200, CONTENT_TYPE
+    return event_schema.dump(event), 200, event_headers(event)
+
+
+def event_headers(event) -> dict:
+    """Get the headers of a response with the data of a single event."""
+    return {**CONTENT_TYPE, "ETag": f'"{event.version}"'}
+
+
+def if_match_versions() -> Optional[list]:
+    """
+    Get the event versions accepted by the If-Match header of the request.
+
+    Returns:
+        the versions, None if any version is accepted
+    """
+    if request.if_match.star_tag:
+        return None
+
+    return [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+
+
+def update_event_response(
+    id: str, user_id: str, values: dict, versions: Optional[list]
+):
+    """
+    Update an event and get the response of the update.
+
+    Args:
+        id: the id of the event to update
+        user_id: the id of the user updating the event
+        values: the new value of each updated column
+        versions: the versions the event is expected to have, None for any
+
+    Returns:
+        updated event data, status code, headers
+    """
+    event = update_event_columns(id, user_id, values, versions)
+
+    if event and "capacity" in values:
+        promote_waitlist(id)
+
+    db.session.commit()
+
+    if not event:
+        creator = (
+            db.session.query(Event.create_user_id).filter_by(id=id, canceled=0).scalar()
+        )
+
+        if not creator:
+            return jsonify(NOT_FOUND_ERROR), 404, CONTENT_TYPE
+
+        if creator != user_id:
+            return jsonify(BAD_REQUEST_ERROR), 400, CONTENT_TYPE
+
+        return jsonify(PRECONDITION_FAILED_ERROR), 412, CONTENT_TYPE
+
+    events_changed()
+    publish_events("updated", [id])
+    return event_schema.dump(event), 200, event_headers(event)
 
 
 @app.route("/events/<id>", methods=["POST"])
+@valid_result
+@signed_token
 def update_event(id: str):
     """
     Update the data associated with the specified event id.
 
-    The user_id in the request must match the create_user_id of
-    the event
+    The user_id in the request, or the user of the access token, must
+    match the create_user_id of the event. When an If-Match header is
+    sent the event must still have the version of its ETag
 
     Args:
         id: the id of the event to update
 
     payload: json {
-        "user_id": str,
+        "user_id": str, not required with an access token
         "description": str,
         "category": str,
         "location": str,
@@ -486,32 +1007,51 @@ def update_event(id: str):
     Returns:
         updated event data, status code, content type
     """
-    try:
-        update_request = event_update_form_schema.loads(json.dumps(request.json))
-        event = db.session.query(Event).filter(Event.id == id).one()
-
-        if event.create_user_id == update_request["user_id"]:
-            for attr, value in update_request.items():
-                if attr != "user_id":
-                    setattr(event, attr, value)
-
-            db.session.commit()
-        return event_schema.dump(event), 200, CONTENT_TYPE
-    except NoResultFound:
-        return NOT_FOUND_ERROR, 404, CONTENT_TYPE
-    except MultipleResultsFound:
-        return (
-            jsonify(CRITICAL_ERROR),
-            500,
-            CONTENT_TYPE,
-        )
-    except IntegrityError:
-        db.session.rollback()
-        return (
-            jsonify(BAD_REQUEST_ERROR),
-            400,
-            CONTENT_TYPE,
-        )
+    update_request = event_update_form_schema.loads(json.dumps(request.json))
+    user_id = token_user_id(update_request)
+    update_request.pop("user_id", None)
+    versions = if_match_versions() if request.if_match else None
+    return update_event_response(id, user_id, update_request, versions)
+
+
+@app.route("/events/<id>", methods=["PATCH"])
+@valid_result
+@signed_token
+def patch_event(id: str):
+    """
+    Update only the supplied fields of the specified event id.
+
+    The request must have an If-Match header with the ETag of the event,
+    the update is rejected when the event changed since that ETag was read.
+    The user_id, or the user of the access token, must match the
+    create_user_id of the event
+
+    Args:
+        id: the id of the event to update
+
+    payload: json {
+        "user_id": str, not required with an access token
+        "description": str,
+        "category": str,
+        "location": str,
+        "cost": str,
+        "start_time": str,
+        "end_time": str,
+        "event_link": str,
+        "latitude": float,
+        "longitude": float,
+    }
+
+    Returns:
+        updated event data, status code, headers
+    """
+    if not request.if_match:
+        return jsonify(PRECONDITION_REQUIRED_ERROR), 428, CONTENT_TYPE
+
+    update_request = event_update_form_schema.loads(json.dumps(request.json))
+    user_id = token_user_id(update_request)
+    update_request.pop("user_id", None)
+    return update_event_response(id, user_id, update_request, if_match_versions())
 
 
 @app.route("/events/<id>/metrics", methods=["GET"])
@@ -527,11 +1067,7 @@ def get_event_metrics(id: str):
         event metric data, status code, content type
     """
     event = db.session.query(Event).filter(Event.id == id).one()
-    registrations = (
-        db.session.query(func.count(EventRegistration.id))
-        .filter_by(event_id=id, canceled=0)
-        .scalar()
-    )
+    registrations = event.registered
     favorites = (
         db.session.query(func.count(EventFavorite.id))
         .filter_by(event_id=id, canceled=0)
@@ -557,33 +1093,34 @@ def get_event_metrics(id: str):
 
 @app.route("/events/registration", methods=["POST"])
 @valid_result
+@signed_token
 def event_registration():
     """
     Register a user for an event.
 
+    When the event has a capacity and all its seats are taken the user
+    is added to its waitlist, the waitlisted position is None when seated.
+    Events that do not exist or are canceled return a not found error
+
     payload: json {
         "event_id": str,
-        "user_id": str,
+        "user_id": str, not required with an access token
     }
 
     Returns:
         event registration data, status code, content type
     """
     registration = event_registration_schema.loads(json.dumps(request.json))
-    event_registration = (
-        db.session.query(EventRegistration)
-        .filter_by(user_id=registration["user_id"], event_id=registration["event_id"])
-        .first()
+    event_registration = commit_write(
+        register_event_user,
+        registration["event_id"],
+        token_user_id(registration),
     )
 
-    if event_registration:
-        event_registration.canceled = 0
+    if not event_registration:
+        return jsonify(NOT_FOUND_ERROR), 404, CONTENT_TYPE
 
-    else:
-        event_registration = EventRegistration(**registration)
-        db.session.add(event_registration)
-
-    db.session.commit()
+    publish_metrics([registration["event_id"]])
 
     return (
         event_registration_schema.dump(event_registration),
@@ -593,11 +1130,13 @@ def event_registration():
 
 
 @app.route("/events/<event_id>/registration/<user_id>", methods=["POST"])
-@one_result
+@signed_token
 def remove_user_registration(event_id: str, user_id: str):
     """
     Unregister a user from the specified event.
 
+    The seat of the user is given to the first user of the waitlist
+
     Args:
         event_id: the id of the event to unregister from
         user_id: the id of the user to unregister
@@ -605,27 +1144,28 @@ def remove_user_registration(event_id: str, user_id: str):
     Returns:
         event registration data, status code, content type
     """
-    registration = (
-        db.session.query(EventRegistration)
-        .filter_by(
-            event_id=event_id,
-            user_id=user_id,
-        )
-        .one()
-    )
-    registration.canceled = 1
-    db.session.commit()
+    if g.token and g.token["user_id"] != user_id:
+        return jsonify(BAD_REQUEST_ERROR), 400, CONTENT_TYPE
+
+    registration = commit_write(unregister_event_user, event_id, user_id)
+
+    if not registration:
+        return jsonify(NOT_FOUND_ERROR), 404, CONTENT_TYPE
+
+    publish_metrics([event_id])
+
     return event_registration_schema.dump(registration), 200, CONTENT_TYPE
 
 
 @app.route("/events/favorite", methods=["POST"])
 @valid_result
+@signed_token
 def event_favorite():
     """
     Create a favorite record for a specific user and event.
 
     payload: json {
-        "user_id": str,
+        "user_id": str, not required with an access token
         "event_id": str,
     }
 
@@ -633,20 +1173,13 @@ def event_favorite():
         event favorite data, status code, content type
     """
     favorite = event_favorite_schema.loads(json.dumps(request.json))
-    event_favorite = (
-        db.session.query(EventFavorite)
-        .filter_by(user_id=favorite["user_id"], event_id=favorite["event_id"])
-        .first()
+    event_favorite = commit_write(
+        activate_event_user,
+        EventFavorite,
+        favorite["event_id"],
+        token_user_id(favorite),
     )
-
-    if event_favorite:
-        event_favorite.canceled = 0
-
-    else:
-        event_favorite = EventFavorite(**favorite)
-        db.session.add(event_favorite)
-
-    db.session.commit()
+    publish_metrics([favorite["event_id"]])
 
     return (
         event_favorite_schema.dump(event_favorite),
@@ -656,6 +1189,7 @@ def event_favorite():
 
 
 @app.route("/events/<event_id>/favorite/<user_id>", methods=["POST"])
+@signed_token
 def remove_user_favorite(event_id: str, user_id: str):
     """
     Unfavorite an event of the specified user.
@@ -667,18 +1201,137 @@ def remove_user_favorite(event_id: str, user_id: str):
     Returns:
         event favorite data, status code, content type
     """
-    favorite = (
-        db.session.query(EventFavorite)
-        .filter_by(event_id=event_id, user_id=user_id)
-        .one()
-    )
-    favorite.canceled = 1
-    db.session.commit()
+    if g.token and g.token["user_id"] != user_id:
+        return jsonify(BAD_REQUEST_ERROR), 400, CONTENT_TYPE
+
+    favorite = commit_write(cancel_event_user, EventFavorite, event_id, user_id)
+
+    if not favorite:
+        return jsonify(NOT_FOUND_ERROR), 404, CONTENT_TYPE
+
+    publish_metrics([event_id])
+
     return event_favorite_schema.dump(favorite), 200, CONTENT_TYPE
 
 
+def event_users_batch(model: db.Model, schema: ma.Schema, activate: bool) -> list:
+    """
+    Register, favorite or remove a user for many events in one transaction.
+
+    payload: json {
+        "user_id": str, not required with an access token
+        "event_ids": [str],
+    }
+
+    Args:
+        model: EventRegistration or EventFavorite
+        schema: the schema used to return the rows
+        activate: True to create or reactivate the rows, False to cancel them
+
+    Returns:
+        the row data of each event id, or an error if it has no row
+    """
+    batch = event_user_batch_schema.loads(json.dumps(request.json))
+    event_ids = list(dict.fromkeys(batch["event_ids"]))
+
+    rows = commit_write(
+        change_event_users,
+        model,
+        event_ids,
+        token_user_id(batch),
+        activate,
+    )
+    publish_metrics(list(rows))
+
+    return [
+        schema.dump(rows[event_id]) if event_id in rows else NOT_FOUND_ERROR
+        for event_id in event_ids
+    ]
+
+
+@app.route("/events/registration/batch", methods=["POST"])
+@valid_result
+@signed_token
+def event_registrations_batch():
+    """
+    Register a user for many events.
+
+    payload: json {
+        "user_id": str, not required with an access token
+        "event_ids": [str],
+    }
+
+    Returns:
+        a list of event registration data, status code, content type
+    """
+    registrations = event_users_batch(
+        EventRegistration, event_registration_schema, activate=True
+    )
+    return jsonify(registrations), 200, CONTENT_TYPE
+
+
+@app.route("/events/registration/batch/remove", methods=["POST"])
+@valid_result
+@signed_token
+def remove_user_registrations_batch():
+    """
+    Unregister a user from many events.
+
+    payload: json {
+        "user_id": str, not required with an access token
+        "event_ids": [str],
+    }
+
+    Returns:
+        a list of event registration data, status code, content type
+    """
+    registrations = event_users_batch(
+        EventRegistration, event_registration_schema, activate=False
+    )
+    return jsonify(registrations), 200, CONTENT_TYPE
+
+
+@app.route("/events/favorite/batch", methods=["POST"])
+@valid_result
+@signed_token
+def event_favorites_batch():
+    """
+    Favorite many events for a user.
+
+    payload: json {
+        "user_id": str, not required with an access token
+        "event_ids": [str],
+    }
+
+    Returns:
+        a list of event favorite data, status code, content type
+    """
+    favorites = event_users_batch(EventFavorite, event_favorite_schema, activate=True)
+    return jsonify(favorites), 200, CONTENT_TYPE
+
+
+@app.route("/events/favorite/batch/remove", methods=["POST"])
+@valid_result
+@signed_token
+def remove_user_favorites_batch():
+    """
+    Unfavorite many events of a user.
+
+    payload: json {
+        "user_id": str, not required with an access token
+        "event_ids": [str],
+    }
+
+    Returns:
+        a list of event favorite data, status code, content type
+    """
+    favorites = event_users_batch(EventFavorite, event_favorite_schema, activate=False)
+    return jsonify(favorites), 200, CONTENT_TYPE
+
+
 @app.route("/events/share", methods=["POST"])
 @valid_result
+@signed_token
 def event_share():
     """
     Store the event that was shared.
@@ -691,12 +1344,14 @@ def event_share():
         share data, status code, content type
     """
     share = event_share_schema.loads(json.dumps(request.json))
+    share["user_id"] = token_user_id(share)
     new_share = EventShare(**share)
 
     event = db.session.query(Event).filter(Event.id == new_share.event_id).one_or_none()
     user = db.session.query(User).filter(User.id == new_share.user_id).one_or_none()
 
     if user and event:
+        hostname = urllib.parse.urlparse(APPLICATION_URL).hostname
         body = f"""
         Hello {new_share.to}! \n
         {user.username} thinks you might be interested in an event:
@@ -705,7 +1360,7 @@ def event_share():
         Location: {event.location}
         Cost: {event.cost}\n
 
-        If you are interested, come to {urllib.parse.urlparse(APPLICATION_URL).hostname} and search for the event above.
+        If you are interested, come to {hostname} and search for the event above.
         We look forward to seeing you!
 
         Kindly,
@@ -720,7 +1375,7 @@ def event_share():
 
         sent = False
 
-        with smtplib.SMTP_SSL(
+        with observe("smtp_send"), smtplib.SMTP_SSL(
             "smtp.gmail.com", port=465, context=ssl.create_default_context()
         ) as smtp:
             smtp.login(EMAIL_USERNAME, EMAIL_PASSWORD)
@@ -728,8 +1383,8 @@ def event_share():
             sent = True
 
         if sent:
-            db.session.add(new_share)
-            db.session.commit()
+            commit_write(db.session.add, new_share)
+            publish_metrics([share["event_id"]])
 
             return (
                 event_share_schema.dump(new_share),
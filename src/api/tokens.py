@@ -0,0 +1,79 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+from api import app, TOKEN_SECRET, TOKEN_TTL
+
+
+def token_key() -> bytes:
+    """
+    Get the key used to sign access tokens.
+
+    The configured TOKEN_SECRET must be shared by every worker process,
+    without it tokens are signed with the random key of this process
+    and are only valid until it restarts
+
+    Returns:
+        the signing key
+    """
+    return (TOKEN_SECRET or app.config["SECRET_KEY"]).encode()
+
+
+def encode(data: bytes) -> str:
+    """Encode bytes as unpadded URL safe base64."""
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode(text: str) -> bytes:
+    """Decode unpadded URL safe base64."""
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign(payload: str) -> str:
+    """Get the HMAC-SHA256 signature of a token payload."""
+    return encode(hmac.new(token_key(), payload.encode(), hashlib.sha256).digest())
+
+
+def create_token(user_id: str, role_id: str, ttl: int = TOKEN_TTL) -> str:
+    """
+    Create a signed access token.
+
+    Args:
+        user_id: the id of the user
+        role_id: the id of the role of the user
+        ttl: the number of seconds the token is valid
+
+    Returns:
+        the token as payload.signature
+    """
+    claims = {"user_id": user_id, "role_id": role_id, "expires": int(time.time()) + ttl}
+    payload = encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{sign(payload)}"
+
+
+def read_token(token: str) -> Optional[dict]:
+    """
+    Verify a signed access token without querying the database.
+
+    Args:
+        token: the token created by create_token
+
+    Returns:
+        the user_id, role_id and expires claims, None if the token is invalid or expired
+    """
+    payload, _, signature = token.partition(".")
+
+    if not hmac.compare_digest(signature.encode(), sign(payload).encode()):
+        return None
+
+    try:
+        claims = json.loads(decode(payload))
+    except ValueError:
+        return None
+
+    if claims["expires"] < time.time():
+        return None
+
+    return claims
@@ -0,0 +1,41 @@
+import argparse
+from api.archive import DEFAULT_BATCH_SIZE, DEFAULT_RETENTION_DAYS, archive
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move canceled rows and past events to the archive tables."
+    )
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=DEFAULT_RETENTION_DAYS,
+        help="the number of days events are kept after they end",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="the number of rows checked per transaction",
+    )
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=0,
+        help="the number of seconds to wait between transactions",
+    )
+    parser.add_argument(
+        "--full-vacuum",
+        action="store_true",
+        help="switch a database created without incremental auto vacuum to it, "
+        "locks the database while it runs",
+    )
+    arguments = parser.parse_args()
+
+    archive(
+        retention_days=arguments.retention_days,
+        batch_size=arguments.batch_size,
+        pause=arguments.pause,
+        full_vacuum=arguments.full_vacuum,
+        progress=lambda table, rows: print(f"{table}: {rows} archived"),
+    )
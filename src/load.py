@@ -0,0 +1,32 @@
+import argparse
+from api.loader import TABLES, DEFAULT_BATCH_SIZE, load_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bulk load user roles, users or events from a CSV or JSONL file."
+    )
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path", help="a .csv or .jsonl file with one row per record")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="the number of rows inserted per transaction",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="the file used to resume an interrupted load, defaults to PATH.checkpoint",
+    )
+    arguments = parser.parse_args()
+
+    result = load_file(
+        arguments.table,
+        arguments.path,
+        batch_size=arguments.batch_size,
+        checkpoint=arguments.checkpoint,
+    )
+    print(
+        "{inserted} inserted, {ignored} already present, "
+        "{rejected} rejected, {skipped} skipped".format(**result)
+    )
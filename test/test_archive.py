@@ -0,0 +1,127 @@
+from sqlalchemy import create_engine
+from api import db
+from api.archive import archive
+
+
+EVENT = {
+    "category": "arts",
+    "location": "bu met",
+    "cost": "free",
+    "start_time": "2020-01-01T10:00:00",
+    "create_user_id": "user",
+    "update_time": "now",
+    "canceled": 0,
+}
+
+
+def create_test_engine(tmp_path):
+    engine = create_engine("sqlite:///" + str(tmp_path / "archive.db"))
+    db.metadata.create_all(engine)
+    return engine
+
+
+def insert(engine, table, rows):
+    engine.execute(db.metadata.tables[table].insert(), rows)
+
+
+def count_rows(engine, table):
+    return engine.execute(f'SELECT COUNT(*) FROM "{table}"').scalar()
+
+
+def test_archive(tmp_path):
+    engine = create_test_engine(tmp_path)
+    insert(
+        engine,
+        "user",
+        [
+            {"id": "user", "username": "user", "password": "", "canceled": 0},
+            {"id": "canceled", "username": "canceled", "password": "", "canceled": 1},
+            {"id": "creator", "username": "creator", "password": "", "canceled": 1},
+        ],
+    )
+    insert(
+        engine,
+        "event",
+        [
+            {
+                **EVENT,
+                "id": str(index),
+                "description": str(index),
+                "description_hash": str(index),
+                "end_time": "2020-01-01T12:00:00",
+            }
+            for index in range(25)
+        ]
+        + [
+            {
+                **EVENT,
+                "id": "current",
+                "description": "current",
+                "description_hash": "current",
+                "end_time": "2999-01-01T12:00:00",
+            },
+            {
+                **EVENT,
+                "id": "future",
+                "description": "future",
+                "description_hash": "future",
+                "end_time": "01/05/2027",
+            },
+            {
+                **EVENT,
+                "id": "canceled",
+                "description": "canceled",
+                "description_hash": "canceled",
+                "end_time": "2999-01-01T12:00:00",
+                "canceled": 1,
+            },
+            {
+                **EVENT,
+                "id": "created",
+                "description": "created",
+                "description_hash": "created",
+                "end_time": "2999-01-01T12:00:00",
+                "create_user_id": "creator",
+            },
+        ],
+    )
+    insert(
+        engine,
+        "event_registration",
+        [
+            {"id": "1", "event_id": "current", "user_id": "user", "canceled": 0},
+            {"id": "2", "event_id": "current", "user_id": "canceled", "canceled": 1},
+            {"id": "3", "event_id": "0", "user_id": "user", "canceled": 0},
+        ],
+    )
+
+    archived = archive(retention_days=30, batch_size=10, engine=engine)
+
+    assert archived == {
+        "event": 26,
+        "event_registration": 2,
+        "event_favorite": 0,
+        "event_share": 0,
+        "user": 1,
+    }
+    assert [row[0] for row in engine.execute("SELECT id FROM event ORDER BY id")] == [
+        "created",
+        "current",
+        "future",
+    ]
+    assert engine.execute("SELECT id FROM event_registration").fetchall() == [("1",)]
+    assert engine.execute('SELECT id FROM "user" ORDER BY id').fetchall() == [
+        ("creator",),
+        ("user",),
+    ]
+    assert count_rows(engine, "archived_event") == 26
+    assert (
+        engine.execute(
+            "SELECT archive_time FROM archived_user WHERE id = 'canceled'"
+        ).scalar()
+        is not None
+    )
+    assert engine.execute("PRAGMA freelist_count").scalar() == 0
+
+    assert archive(retention_days=30, engine=engine)["event"] == 0
+    assert count_rows(engine, "archived_event") == 26
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+from api import app
+from api.broker import Broker, broker
+from api.routes import stream_events
+
+
+def test_broker_publish():
+    broker = Broker()
+    first = broker.subscribe()
+    second = broker.subscribe()
+    broker.unsubscribe(second)
+    broker.publish({"type": "event", "id": "1"})
+
+    assert first.get_nowait() == {"type": "event", "id": "1"}
+    assert second.empty()
+
+
+def test_broker_full_subscriber():
+    broker = Broker()
+    subscriber = broker.subscribe()
+
+    for index in range(subscriber.maxsize + 1):
+        broker.publish({"type": "event", "id": index})
+
+    assert subscriber.qsize() == subscriber.maxsize
+    assert subscriber.get_nowait()["id"] == 0
+
+
+def test_broker_other_worker(tmp_path):
+    broker = Broker(str(tmp_path))
+    subscriber = broker.subscribe()
+    # A dead worker socket is removed when publishing
+    (tmp_path / "broker-0.sock").touch()
+
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from api.broker import Broker;"
+            f"Broker({str(tmp_path)!r}).publish({{'type': 'metrics', 'id': '1'}})",
+        ],
+        env={**os.environ, "PYTHONPATH": os.path.join(os.getcwd(), "src")},
+        check=True,
+    )
+
+    assert subscriber.get(timeout=5) == {"type": "metrics", "id": "1"}
+
+
+def test_stream_subscriber():
+    with app.test_request_context("/events/stream"):
+        response, status, _ = stream_events()
+
+    # A stream that is never read does not subscribe
+    assert status == 200
+    assert not broker.subscribers
+
+    frames = iter(response.response)
+
+    assert next(frames) == "retry: 3000\n\n"
+    assert len(broker.subscribers) == 1
+
+    response.close()
+
+    assert not broker.subscribers
@@ -0,0 +1,45 @@
+from api.cache import Cache, event_cache, events_changed
+
+
+def test_cache_size():
+    cache = Cache(size=2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    cache.get("c", lambda: 3)
+
+    assert list(cache.values) == ["b", "c"]
+    assert cache.get("a", lambda: 4) == 4
+
+
+def test_cache_discard():
+    cache = Cache()
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    cache.discard("a")
+
+    assert cache.get("a", lambda: 3) == 3
+    assert cache.get("b", lambda: 4) == 2
+
+
+def test_cache_discard_during_load():
+    cache = Cache()
+
+    def load():
+        cache.discard("a")
+        return 1
+
+    assert cache.get("a", load) == 1
+    assert "a" not in cache.values
+
+
+def test_event_cache_size():
+    cache = event_cache(ttl=60, size=2)
+
+    for key in range(5):
+        cache.get(key, lambda: key)
+
+    assert list(cache.values) == [3, 4]
+
+    events_changed()
+
+    assert cache.values == {}
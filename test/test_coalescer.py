@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import pytest
+from api import app, db, routes
+from api.coalescer import WriteCoalescer
+
+
+def session_write(value: int) -> tuple:
+    return id(db.session()), threading.get_ident(), value
+
+
+def failing_write(value: int):
+    raise ValueError(value)
+
+
+def test_coalescer_batch():
+    coalescer = WriteCoalescer(interval=10, size=4)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(lambda value: coalescer.submit(session_write, value), range(4))
+        )
+
+    # The batch is flushed once it has size writes, in one session and thread
+    assert len({result[:2] for result in results}) == 1
+    assert [result[2] for result in results] == [0, 1, 2, 3]
+
+
+def test_coalescer_failing_write():
+    coalescer = WriteCoalescer(interval=10, size=3)
+
+    def submit(value: int):
+        write = failing_write if value == 1 else session_write
+
+        try:
+            return coalescer.submit(write, value)[2]
+        except ValueError as error:
+            return error
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(submit, range(3)))
+
+    assert results[0] == 0
+    assert isinstance(results[1], ValueError)
+    assert results[2] == 2
+
+
+def test_coalescer_flush_error():
+    coalescer = WriteCoalescer(interval=0, size=1)
+    flush = coalescer.flush
+
+    def failing_flush(batch: list):
+        coalescer.flush = flush
+        raise RuntimeError("rollback failed")
+
+    coalescer.flush = failing_flush
+
+    with pytest.raises(RuntimeError):
+        coalescer.submit(session_write, 0)
+
+    # The thread survives the failed batch
+    assert coalescer.submit(session_write, 1)[2] == 1
+
+
+def test_coalescer_timeout():
+    coalescer = WriteCoalescer(interval=0, size=1, timeout=0.1)
+    committed = threading.Event()
+
+    with pytest.raises(TimeoutError):
+        coalescer.submit(committed.wait)
+
+    committed.set()
+
+
+def test_write_timeout_response(monkeypatch):
+    def timeout(*args):
+        raise TimeoutError()
+
+    monkeypatch.setattr(routes, "commit_write", timeout)
+    response = app.test_client().post(
+        "/events/favorite", json={"event_id": "event", "user_id": "user"}
+    )
+
+    assert response.status_code == 503
+    assert response.json == {"error": "Service Unavailable"}
@@ -0,0 +1,49 @@
+import gzip
+from flask import Response
+from api import app, COMPRESSION_MIN_SIZE
+from api.compression import compress, compressed_cache
+
+BODY = b'{"description": "test event"}' * COMPRESSION_MIN_SIZE
+
+
+def compress_response(body, accept_encoding, method="GET"):
+    with app.test_request_context(
+        "/events", method=method, headers={"Accept-Encoding": accept_encoding}
+    ):
+        return compress(Response(body, mimetype="application/json"))
+
+
+def test_compress_gzip():
+    response = compress_response(BODY, "gzip, deflate")
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Content-Length"] == str(len(response.get_data()))
+    assert "Accept-Encoding" in response.vary
+    assert gzip.decompress(response.get_data()) == BODY
+
+
+def test_compress_cached():
+    compressed_cache.clear()
+    first = compress_response(BODY, "gzip").get_data()
+
+    assert len(compressed_cache.values) == 1
+    assert compress_response(BODY, "gzip").get_data() == first
+    assert len(compressed_cache.values) == 1
+
+    compress_response(BODY, "gzip", method="POST")
+
+    assert len(compressed_cache.values) == 1
+
+
+def test_compress_skipped():
+    small = compress_response(b"{}", "gzip")
+    identity = compress_response(BODY, "identity")
+
+    assert "Content-Encoding" not in small.headers
+    assert "Content-Encoding" not in identity.headers
+    assert identity.get_data() == BODY
+
+    with app.test_request_context("/events", headers={"Accept-Encoding": "gzip"}):
+        stream = compress(Response(iter([BODY]), mimetype="text/event-stream"))
+
+    assert "Content-Encoding" not in stream.headers
@@ -0,0 +1,24 @@
+import threading
+import time
+from api.cpu_profiler import StackSampler
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_stack_sampler(tmp_path):
+    sampler = StackSampler(threading.get_ident())
+    sampler.enable()
+    busy_wait(0.05)
+    sampler.disable()
+
+    path = tmp_path / "profile.collapsed"
+    sampler.dump_stats(str(path))
+    lines = path.read_text().splitlines()
+
+    assert lines
+    assert any(";busy_wait (test_cpu_profiler.py:" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
@@ -0,0 +1,168 @@
+import json
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import StatementError
+from api import db
+from api.archive import create_archive_table
+from api.loader import (
+    EVENT_INSERT_TRIGGERS,
+    insert_events,
+    load_file,
+    insert_rows,
+    write_checkpoint,
+)
+
+
+EVENT = {
+    "category": "science and technology",
+    "location": "bu met",
+    "cost": "free",
+    "start_time": "some date format",
+    "end_time": "some other date",
+    "create_user_id": "loader user",
+    "update_time": "now",
+}
+
+
+def create_test_engine(tmp_path):
+    engine = create_engine("sqlite:///" + str(tmp_path / "loader.db"))
+    db.metadata.create_all(engine)
+    return engine
+
+
+def create_indexed_engine(tmp_path):
+    engine = create_test_engine(tmp_path)
+    create_archive_table("event", engine)
+
+    # The indexes and triggers of the event table of the application database
+    for name in ("event_search", "event_location", *EVENT_INSERT_TRIGGERS):
+        engine.execute(
+            db.engine.execute(
+                "SELECT sql FROM sqlite_master WHERE name = ?", name
+            ).scalar()
+        )
+
+    return engine
+
+
+def count_triggers(engine):
+    return engine.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'"
+    ).scalar()
+
+
+def write_events(path, count):
+    with open(path, "w") as events:
+        for index in range(count):
+            events.write(
+                json.dumps({**EVENT, "id": str(index), "description": str(index)})
+            )
+            events.write("\n")
+
+
+def count_rows(engine, table):
+    return engine.execute(f"SELECT COUNT(*) FROM {table}").scalar()
+
+
+def test_load_events(tmp_path):
+    engine = create_test_engine(tmp_path)
+    path = str(tmp_path / "events.jsonl")
+    write_events(path, 25)
+
+    result = load_file("events", path, batch_size=10, engine=engine)
+
+    assert result == {"inserted": 25, "ignored": 0, "rejected": 0, "skipped": 0}
+    assert count_rows(engine, "event") == 25
+    assert engine.execute("SELECT canceled FROM event WHERE id = '7'").scalar() == 0
+
+    result = load_file("events", path, batch_size=10, engine=engine)
+
+    assert result == {"inserted": 0, "ignored": 25, "rejected": 0, "skipped": 0}
+    assert count_rows(engine, "event") == 25
+
+
+def test_load_events_resume(tmp_path):
+    engine = create_test_engine(tmp_path)
+    path = str(tmp_path / "events.jsonl")
+    write_events(path, 25)
+    write_checkpoint(path + ".checkpoint", 20)
+
+    result = load_file("events", path, batch_size=10, engine=engine)
+
+    assert result == {"inserted": 5, "ignored": 0, "rejected": 0, "skipped": 20}
+    assert count_rows(engine, "event") == 5
+
+
+def test_load_csv_users(tmp_path):
+    engine = create_test_engine(tmp_path)
+    path = str(tmp_path / "users.csv")
+
+    with open(path, "w") as users:
+        users.write("username,password,user_role_id\n")
+        users.write("Loader Person,test,\n")
+        users.write(",test,\n")
+
+    result = load_file("users", path, engine=engine)
+    user = engine.execute("SELECT username, password, user_role_id FROM user").first()
+
+    assert result == {"inserted": 1, "ignored": 0, "rejected": 1, "skipped": 0}
+    assert user[0] == "loader person"
+    assert user[1].startswith("$argon2")
+
+
+def test_insert_invalid_rows(tmp_path):
+    engine = create_test_engine(tmp_path)
+
+    result = insert_rows(
+        "roles",
+        [{"role_name": "Loader"}, {"role_name": "Loader"}, {"unknown": "field"}],
+        engine=engine,
+    )
+
+    assert result == {"inserted": 1, "ignored": 1, "rejected": 1, "skipped": 0}
+
+
+def test_load_indexed_events(tmp_path):
+    engine = create_indexed_engine(tmp_path)
+    insert_rows(
+        "events", [{**EVENT, "id": "first", "description": "first"}], engine=engine
+    )
+
+    result = insert_rows(
+        "events",
+        [
+            {**EVENT, "id": str(index), "description": f"loaded {index}"}
+            for index in range(25)
+        ]
+        + [
+            {
+                **EVENT,
+                "id": "located",
+                "description": "located",
+                "latitude": 42.35,
+                "longitude": -71.1,
+            }
+        ],
+        batch_size=10,
+        engine=engine,
+    )
+    changes = [
+        row[0] for row in engine.execute("SELECT change_seq FROM event ORDER BY rowid")
+    ]
+
+    assert result["inserted"] == 26
+    assert changes == list(range(1, 28))
+    assert (
+        engine.execute(
+            "SELECT COUNT(*) FROM event_search WHERE event_search MATCH 'loaded'"
+        ).scalar()
+        == 25
+    )
+    assert engine.execute("SELECT id FROM event_location").fetchall() == [(27,)]
+    assert count_triggers(engine) == len(EVENT_INSERT_TRIGGERS)
+
+    # A failed batch leaves the triggers in place
+    with pytest.raises(StatementError), engine.begin() as connection:
+        insert_events(connection, db.metadata.tables["event"].insert(), [{"id": {}}])
+
+    assert count_triggers(engine) == len(EVENT_INSERT_TRIGGERS)
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from api import metrics
+
+
+def test_collect_skips_exited_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIRECTORY", str(tmp_path))
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    snapshot = {"values": [["isea_http_requests_in_flight", [], 3]], "histograms": []}
+
+    running = tmp_path / f"metrics-{os.getppid()}.json"
+    stale = tmp_path / f"metrics-{exited.pid}.json"
+    running.write_text(json.dumps(snapshot))
+    stale.write_text(json.dumps(snapshot))
+
+    snapshots = metrics.collect()
+
+    assert snapshots[1:] == [snapshot]
+    assert running.exists()
+    assert not stale.exists()
+
+
+def test_snapshot_after_last_request(tmp_path):
+    # The worker serves two requests and stays idle
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import time; from api import app;"
+            "app.test_client().get('/');"
+            "app.test_client().get('/');"
+            "time.sleep(3 * __import__('api.metrics').metrics.SNAPSHOT_INTERVAL)",
+        ],
+        env={
+            **os.environ,
+            "PYTHONPATH": os.path.join(os.getcwd(), "src"),
+            "METRICS_DIRECTORY": str(tmp_path),
+        },
+        check=True,
+    )
+    [path] = tmp_path.glob("metrics-*.json")
+    values = json.loads(path.read_text())["values"]
+
+    assert ["isea_http_requests_in_flight", [], 0] in values
+    assert (
+        sum(value for name, _, value in values if name == "isea_http_requests_total")
+        == 2
+    )
+
+
+def test_failed_query():
+    engine = create_engine("sqlite://")
+
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute("SELECT * FROM missing")
+
+        assert connection.info["query_start"] == {}
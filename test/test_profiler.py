@@ -0,0 +1,25 @@
+from api.profiler import statement_shape, QueryProfile
+
+
+def test_statement_shape():
+    first = statement_shape("SELECT * FROM event WHERE id IN (?, ?) AND cost > 5")
+    second = statement_shape(
+        "SELECT *\nFROM event WHERE id IN (?, ?, ?)  AND cost > 10"
+    )
+
+    assert first == second
+    assert first == "SELECT * FROM event WHERE id IN (?...) AND cost > ?"
+    assert statement_shape("SELECT 'it''s', anon_1") == "SELECT ?, anon_1"
+
+
+def test_query_profile():
+    profile = QueryProfile()
+
+    for _ in range(3):
+        profile.add("SELECT * FROM user_role WHERE id = ?", 1.0)
+
+    profile.add("SELECT * FROM event", 500.0)
+
+    assert profile.summary() == "queries=4; time_ms=503.00; slow=1; repeated=1"
+    assert profile.repeated()[0][:2] == ("SELECT * FROM user_role WHERE id = ?", 3)
+    assert profile.slow()[0][0] == "SELECT * FROM event"
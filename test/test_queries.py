@@ -0,0 +1,53 @@
+from sqlalchemy import func
+from api import db
+from api.models import Event
+from api.queries import filter_events
+
+
+def query_plan(query):
+    compiled = query.statement.compile(db.engine)
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.engine.execute("EXPLAIN QUERY PLAN " + str(compiled), parameters)
+    return " ".join(row[-1] for row in rows)
+
+
+def test_filter_events_plan():
+    plan = query_plan(filter_events({}))
+
+    assert "USING INDEX ix_event_canceled_start_time" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_filter_events_selective_plans():
+    filters = {
+        "category": "ix_event_canceled_category_start_time",
+        "location": "ix_event_location_canceled_start_time",
+        "creator": "ix_event_create_user_id_canceled_start_time",
+    }
+
+    for name, index in filters.items():
+        plan = query_plan(
+            filter_events({name: "value", "start_from": "2022", "start_to": "2023"})
+        )
+
+        assert f"SEARCH event USING INDEX {index}" in plan
+        assert "SCAN" not in plan
+        assert "TEMP B-TREE" not in plan
+
+
+def test_filter_events_cost_plan():
+    plan = query_plan(filter_events({"min_cost": 5, "max_cost": 20, "sort": "cost"}))
+
+    assert "SEARCH event USING INDEX ix_event_canceled_cost_cents" in plan
+    assert "SCAN" not in plan
+
+
+def test_count_categories_plan():
+    plan = query_plan(
+        db.session.query(Event.category, func.count())
+        .filter(Event.canceled == 0)
+        .group_by(Event.category)
+    )
+
+    assert "USING COVERING INDEX ix_event_canceled_category_start_time" in plan
+    assert "TEMP B-TREE" not in plan
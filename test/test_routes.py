@@ -1,13 +1,16 @@
 import requests
 import json
 import uuid
-from api import ADMIN_ROLE_UUID, USER_ROLE_UUID, APPLICATION_URL
+from concurrent.futures import ThreadPoolExecutor
+from api import ADMIN_ROLE_UUID, USER_ROLE_UUID, APPLICATION_URL, GROUP_COMMIT_MS
+from api.archive import archive_table
 
 
 CONTENT_TYPE = "application/json"
 API_KEY = "TBD"
 VALID_HEADERS = {"Content-Type": CONTENT_TYPE, "x-api-key": API_KEY}
 
+METRICS_URL = APPLICATION_URL + "/metrics"
 USER_ROLES_URL = APPLICATION_URL + "/users/roles"
 USERS_URL = APPLICATION_URL + "/users"
 USERS_LOGIN_URL = APPLICATION_URL + "/users/login"
@@ -17,11 +20,20 @@ USER_REGISTRATIONS_URL = APPLICATION_URL + "/users/{}/registration"
 USER_SUGGESTIONS_URL = APPLICATION_URL + "/users/{}/suggestion"
 
 EVENTS_URL = APPLICATION_URL + "/events"
+EVENTS_BULK_URL = APPLICATION_URL + "/events/bulk"
+EVENTS_BULK_REMOVE_URL = APPLICATION_URL + "/events/bulk/remove"
+EVENTS_SEARCH_URL = APPLICATION_URL + "/events/search"
+EVENT_CATEGORIES_URL = APPLICATION_URL + "/events/categories"
+EVENTS_NEARBY_URL = APPLICATION_URL + "/events/nearby"
+EVENTS_CHANGES_URL = APPLICATION_URL + "/events/changes"
+EVENTS_STREAM_URL = APPLICATION_URL + "/events/stream"
 EVENT_ID_URL = APPLICATION_URL + "/events/{}"
 EVENT_METRICS_URL = APPLICATION_URL + "/events/{}/metrics"
 EVENTS_REGISTRATION_URL = APPLICATION_URL + "/events/registration"
 EVENT_REGISTRATION_REMOVAL_URL = APPLICATION_URL + "/events/{}/registration/{}"
+EVENTS_REGISTRATION_BATCH_URL = APPLICATION_URL + "/events/registration/batch"
 EVENTS_FAVORITE_URL = APPLICATION_URL + "/events/favorite"
+EVENTS_FAVORITE_BATCH_URL = APPLICATION_URL + "/events/favorite/batch"
 EVENT_FAVORITE_REMOVAL_URL = APPLICATION_URL + "/events/{}/favorite/{}"
 EVENTS_SHARE_URL = APPLICATION_URL + "/events/share"
 
@@ -76,7 +88,8 @@ def test_user_creation():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 3
+    assert len(response_body.keys()) == 4
+    assert response_body["role_name"] == "User"
     assert response_body["user_role_id"] == USER_ROLE_UUID
     assert response_body["id"] == USER_UUID
     assert response_body["username"] == "test person"
@@ -95,7 +108,9 @@ def test_user_login():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 3
+    assert len(response_body.keys()) == 5
+    assert response_body["token"]
+    assert response_body["role_name"] == "User"
     assert response_body["user_role_id"] == USER_ROLE_UUID
     assert response_body["id"] == USER_UUID
     assert response_body["username"] == "test person"
@@ -113,6 +128,7 @@ def test_get_all_users():
     assert len(response_body) == 1
     assert response_body[0]["user_role_id"] == USER_ROLE_UUID
     assert response_body[0]["id"] == USER_UUID
+    assert response_body[0]["role_name"] == "User"
     assert response_body[0]["username"] == "test person"
 
 
@@ -126,7 +142,8 @@ def test_get_single_user():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 3
+    assert len(response_body.keys()) == 4
+    assert response_body["role_name"] == "User"
     assert response_body["user_role_id"] == USER_ROLE_UUID
     assert response_body["id"] == USER_UUID
     assert response_body["username"] == "test person"
@@ -153,7 +170,7 @@ def test_create_event():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 10
+    assert len(response_body.keys()) == 13
     assert response_body["create_user_id"] == USER_UUID
     assert response_body["id"] == EVENT_UUID
     assert response_body["description"] == "test event"
@@ -169,7 +186,7 @@ def test_get_events():
 
     assert request.status_code == 200
     assert len(response_body) == 1
-    assert len(response_body[0].keys()) == 10
+    assert len(response_body[0].keys()) == 13
     assert response_body[0]["create_user_id"] == USER_UUID
     assert response_body[0]["id"] == EVENT_UUID
     assert response_body[0]["description"] == "test event"
@@ -185,7 +202,7 @@ def test_get_single_event():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 10
+    assert len(response_body.keys()) == 13
     assert response_body["create_user_id"] == USER_UUID
     assert response_body["id"] == EVENT_UUID
     assert response_body["description"] == "test event"
@@ -211,7 +228,7 @@ def test_update_single_event():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 10
+    assert len(response_body.keys()) == 13
     assert response_body["create_user_id"] == USER_UUID
     assert response_body["id"] == EVENT_UUID
     assert response_body["description"] == "test event UPDATED"
@@ -230,7 +247,7 @@ def test_event_registration():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 3
+    assert len(response_body.keys()) == 4
     assert response_body["user_id"] == USER_UUID
     assert response_body["event_id"] == EVENT_UUID
 
@@ -344,7 +361,7 @@ def test_remove_event_registration():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 3
+    assert len(response_body.keys()) == 4
     assert response_body["user_id"] == USER_UUID
     assert response_body["event_id"] == EVENT_UUID
 
@@ -424,11 +441,24 @@ def test_user_delete():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 3
+    assert len(response_body.keys()) == 4
+    assert response_body["role_name"] == "User"
     assert response_body["user_role_id"] == USER_ROLE_UUID
     assert response_body["id"] == user_id
     assert response_body["username"] == "test delete"
 
+    request = requests.delete(
+        USERS_URL,
+        json={
+            "user_id": user_id,
+            "requester_id": ADMIN_UUID,
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 404
+
     request = requests.get(
         USERS_URL,
         headers=VALID_HEADERS,
@@ -459,7 +489,1153 @@ def test_delete_event():
     response_body = json.loads(request.text)
 
     assert request.status_code == 200
-    assert len(response_body.keys()) == 10
+    assert len(response_body.keys()) == 13
     assert response_body["create_user_id"] == USER_UUID
     assert response_body["id"] == EVENT_UUID
     assert response_body["description"] == "test event UPDATED"
+
+    # A canceled event can not be canceled or updated again
+    request = requests.delete(
+        EVENTS_URL,
+        json={
+            "event_id": EVENT_UUID,
+            "requester_id": ADMIN_UUID,
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 404
+
+    request = requests.post(
+        EVENT_ID_URL.format(EVENT_UUID),
+        json={"user_id": USER_UUID, "location": "canceled location"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 404
+
+
+def test_create_events_bulk():
+    event = {
+        "category": "arts",
+        "location": "bu met",
+        "cost": "free",
+        "start_time": "some date format",
+        "end_time": "some other date",
+        "create_user_id": USER_UUID,
+        "update_time": "now",
+    }
+    request = requests.post(
+        EVENTS_BULK_URL,
+        json=[
+            {**event, "description": "bulk event"},
+            {**event, "description": "test event UPDATED"},
+            {**event, "description": "bulk event"},
+            {"description": "incomplete bulk event"},
+        ],
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 4
+    assert len(response_body[0].keys()) == 13
+    assert response_body[0]["description"] == "bulk event"
+    assert response_body[1]["error"] == "Event Not Possible To Create"
+    assert response_body[2]["error"] == "Event Not Possible To Create"
+    assert response_body[3]["error"] == "Bad Request"
+
+    request = requests.get(
+        EVENTS_URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 1
+    assert response_body[0]["description"] == "bulk event"
+
+
+def test_create_duplicate_event():
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "description": "  Bulk   EVENT ",
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "event_link": "some url",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 400
+    assert response_body["error"] == "Event Not Possible To Create"
+
+
+def test_repeated_event_registration():
+    event_id = create_test_event("repeated registration event")
+
+    for _ in range(2):
+        request = requests.post(
+            EVENTS_REGISTRATION_URL,
+            json={
+                "user_id": USER_UUID,
+                "event_id": event_id,
+            },
+            headers=VALID_HEADERS,
+            verify=False,
+        )
+
+        assert request.status_code == 200
+
+    URL = EVENT_METRICS_URL.format(event_id)
+    request = requests.get(
+        URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["registrations"] == 1
+
+    URL = EVENT_REGISTRATION_REMOVAL_URL.format(event_id, USER_UUID)
+    request = requests.post(
+        URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 200
+
+    request = requests.delete(
+        EVENTS_URL,
+        json={"event_id": event_id, "requester_id": ADMIN_UUID},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 200
+
+
+def test_remove_missing_event_favorite():
+    URL = EVENT_FAVORITE_REMOVAL_URL.format(EVENT_UUID, ADMIN_UUID)
+    request = requests.post(
+        URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 404
+    assert response_body["error"] == "Result Not Found"
+
+
+def test_event_favorites_batch():
+    request = requests.post(
+        EVENTS_FAVORITE_BATCH_URL,
+        json={
+            "user_id": USER_UUID,
+            "event_ids": [EVENT_UUID, EVENT_UUID],
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 1
+    assert response_body[0]["user_id"] == USER_UUID
+    assert response_body[0]["event_id"] == EVENT_UUID
+
+    URL = EVENT_METRICS_URL.format(EVENT_UUID)
+    request = requests.get(
+        URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["favorites"] == 1
+
+    request = requests.post(
+        EVENTS_FAVORITE_BATCH_URL + "/remove",
+        json={
+            "user_id": USER_UUID,
+            "event_ids": [EVENT_UUID, "missing event"],
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 2
+    assert response_body[0]["event_id"] == EVENT_UUID
+    assert response_body[1]["error"] == "Result Not Found"
+
+    URL = EVENT_METRICS_URL.format(EVENT_UUID)
+    request = requests.get(
+        URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["favorites"] == 0
+
+
+def test_event_registrations_batch_invalid():
+    request = requests.post(
+        EVENTS_REGISTRATION_BATCH_URL,
+        json={
+            "user_id": USER_UUID,
+            "event_ids": EVENT_UUID,
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+
+def test_search_events():
+    request = requests.get(
+        EVENTS_SEARCH_URL,
+        params={"q": "bul"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 1
+    assert response_body[0]["description"] == "bulk event"
+
+    request = requests.get(
+        EVENTS_SEARCH_URL,
+        params={"q": "bulk", "page": 2},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 0
+
+    request = requests.get(
+        EVENTS_SEARCH_URL,
+        params={"q": "test event"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 0
+
+
+def test_search_events_invalid():
+    request = requests.get(
+        EVENTS_SEARCH_URL,
+        params={"q": "***"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+    request = requests.get(
+        EVENTS_SEARCH_URL,
+        params={"q": "bulk", "per_page": 1000},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+
+def test_filter_events():
+    filters = [
+        ({"category": "arts"}, 1),
+        ({"category": "arts", "location": "bu met", "max_cost": 0}, 1),
+        ({"category": "science and technology"}, 0),
+        ({"creator": USER_UUID, "from": "some", "to": "some z"}, 1),
+        ({"from": "some z"}, 0),
+        ({"unknown": "ignored"}, 1),
+    ]
+
+    for params, count in filters:
+        request = requests.get(
+            EVENTS_URL,
+            params=params,
+            headers=VALID_HEADERS,
+            verify=False,
+        )
+        response_body = json.loads(request.text)
+
+        assert request.status_code == 200
+        assert len(response_body) == count
+
+    request = requests.get(
+        EVENTS_URL,
+        params={"max_cost": "free"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+
+def test_filter_events_by_cost():
+    event = {
+        "category": "arts",
+        "location": "bu met",
+        "start_time": "some date format",
+        "end_time": "some other date",
+        "create_user_id": USER_UUID,
+        "update_time": "now",
+    }
+    requests.post(
+        EVENTS_BULK_URL,
+        json=[
+            {**event, "description": "paid event", "cost": "$20.50"},
+            {**event, "description": "cheap event", "cost": "5 USD"},
+        ],
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    request = requests.get(
+        EVENTS_URL,
+        params={"min_cost": 1, "max_cost": 20.5, "sort": "cost"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 2
+    assert response_body[0]["description"] == "cheap event"
+    assert response_body[1]["description"] == "paid event"
+
+    request = requests.get(
+        EVENTS_URL,
+        params={"max_cost": 0},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 1
+    assert response_body[0]["description"] == "bulk event"
+
+
+def test_event_categories():
+    request = requests.get(
+        EVENT_CATEGORIES_URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body == [{"category": "arts", "count": 3}]
+
+    requests.post(
+        EVENTS_URL,
+        json={
+            "description": "category event",
+            "category": "music",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    request = requests.get(
+        EVENT_CATEGORIES_URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body == [
+        {"category": "arts", "count": 3},
+        {"category": "music", "count": 1},
+    ]
+
+    request = requests.get(
+        EVENT_CATEGORIES_URL,
+        params={"from": "some z"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body == []
+
+
+def test_nearby_events():
+    event = {
+        "category": "sports",
+        "location": "boston",
+        "cost": "free",
+        "start_time": "some date format",
+        "end_time": "some other date",
+        "create_user_id": USER_UUID,
+        "update_time": "now",
+    }
+    requests.post(
+        EVENTS_BULK_URL,
+        json=[
+            {
+                **event,
+                "description": "bu event",
+                "latitude": 42.3505,
+                "longitude": -71.1054,
+            },
+            {
+                **event,
+                "description": "harvard event",
+                "latitude": 42.377,
+                "longitude": -71.1167,
+            },
+            {
+                **event,
+                "description": "nyc event",
+                "latitude": 40.7128,
+                "longitude": -74.006,
+            },
+        ],
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    request = requests.get(
+        EVENTS_NEARBY_URL,
+        params={"lat": 42.35, "lon": -71.105},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 2
+    assert response_body[0]["description"] == "bu event"
+    assert response_body[0]["latitude"] == 42.3505
+    assert response_body[0]["distance"] < 0.1
+    assert response_body[1]["description"] == "harvard event"
+    assert 2.5 < response_body[1]["distance"] < 3.5
+
+    request = requests.get(
+        EVENTS_NEARBY_URL,
+        params={"lat": 42.35, "lon": -71.105, "radius": 1},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert len(response_body) == 1
+
+    request = requests.get(
+        EVENTS_NEARBY_URL,
+        params={"lat": 100, "lon": -71.105},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+
+def test_metrics():
+    request = requests.get(
+        METRICS_URL,
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 200
+    assert request.headers["Content-Type"].startswith("text/plain")
+    assert "# TYPE isea_http_request_duration_seconds histogram" in request.text
+    assert (
+        'isea_http_requests_total{endpoint="get_events",method="GET",status="200"}'
+        in request.text
+    )
+    assert (
+        'isea_db_queries_count{endpoint="create_event",method="POST"}' in request.text
+    )
+    assert (
+        'isea_operation_duration_seconds_count{operation="argon2_hash"}' in request.text
+    )
+    assert "isea_http_requests_in_flight 1" in request.text
+
+
+def test_delete_event_with_token():
+    request = requests.post(
+        USERS_LOGIN_URL,
+        json={
+            "username": "test admin",
+            "password": "test",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    token = json.loads(request.text)["token"]
+
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "description": "token event",
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    event_id = json.loads(request.text)["id"]
+
+    request = requests.delete(
+        EVENTS_URL,
+        json={"event_id": event_id},
+        headers={**VALID_HEADERS, "Authorization": "Bearer " + token[:-1]},
+        verify=False,
+    )
+
+    assert request.status_code == 401
+
+    request = requests.delete(
+        EVENTS_URL,
+        json={"event_id": event_id},
+        headers={**VALID_HEADERS, "Authorization": "Bearer " + token},
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["id"] == event_id
+
+
+def test_event_changes():
+    request = requests.get(
+        EVENTS_CHANGES_URL,
+        params={"since": 0, "per_page": 1000},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["more"] is False
+    cursor = response_body["cursor"]
+
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "description": "changed event",
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    event_id = json.loads(request.text)["id"]
+
+    request = requests.get(
+        EVENTS_CHANGES_URL,
+        params={"since": cursor},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert [event["id"] for event in response_body["events"]] == [event_id]
+    assert response_body["deleted"] == []
+    assert response_body["cursor"] == cursor + 1
+    cursor = response_body["cursor"]
+
+    requests.delete(
+        EVENTS_URL,
+        json={"event_id": event_id, "requester_id": USER_UUID},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    request = requests.get(
+        EVENTS_CHANGES_URL,
+        params={"since": cursor},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["events"] == []
+    assert response_body["deleted"] == [event_id]
+    assert response_body["cursor"] == cursor + 1
+
+
+def create_test_event(description: str) -> str:
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "description": description,
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    return json.loads(request.text)["id"]
+
+
+def test_update_event_not_creator():
+    URL = EVENT_ID_URL.format(create_test_event("not my event"))
+    request = requests.post(
+        URL,
+        json={"user_id": ADMIN_UUID, "description": "not my event"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+    request = requests.post(
+        EVENT_ID_URL.format("missing event"),
+        json={"user_id": USER_UUID, "description": "missing event"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 404
+
+
+def test_delete_events_bulk():
+    event = {
+        "category": "arts",
+        "location": "bu met",
+        "cost": "free",
+        "start_time": "some date format",
+        "end_time": "some other date",
+        "create_user_id": USER_UUID,
+        "update_time": "now",
+    }
+    request = requests.post(
+        EVENTS_BULK_URL,
+        json=[
+            {**event, "description": "bulk remove one"},
+            {**event, "description": "bulk remove two"},
+        ],
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    event_ids = [event["id"] for event in json.loads(request.text)]
+
+    request = requests.post(
+        EVENTS_BULK_REMOVE_URL,
+        json={"event_ids": event_ids, "requester_id": "not the creator"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body == [{"error": "Bad Request"}, {"error": "Bad Request"}]
+
+    request = requests.post(
+        EVENTS_BULK_REMOVE_URL,
+        json={"event_ids": event_ids + ["missing event"], "requester_id": USER_UUID},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert [event["id"] for event in response_body[:2]] == event_ids
+    assert response_body[2] == {"error": "Result Not Found"}
+
+    request = requests.post(
+        EVENTS_BULK_REMOVE_URL,
+        json={"event_ids": event_ids, "requester_id": USER_UUID},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert json.loads(request.text) == [{"error": "Result Not Found"}] * 2
+
+    request = requests.delete(
+        EVENTS_URL,
+        json={"event_id": "missing event", "requester_id": USER_UUID},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 404
+
+
+def test_patch_event():
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+            "description": "patched event",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    URL = EVENT_ID_URL.format(json.loads(request.text)["id"])
+    request = requests.get(URL, headers=VALID_HEADERS, verify=False)
+    etag = request.headers["ETag"]
+
+    request = requests.patch(
+        URL,
+        json={"user_id": USER_UUID, "location": "bu cas"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 428
+
+    request = requests.patch(
+        URL,
+        json={"user_id": USER_UUID, "location": "bu cas"},
+        headers={**VALID_HEADERS, "If-Match": etag},
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["location"] == "bu cas"
+    assert response_body["description"] == "patched event"
+    assert request.headers["ETag"] != etag
+
+    request = requests.patch(
+        URL,
+        json={"user_id": USER_UUID, "location": "bu com"},
+        headers={**VALID_HEADERS, "If-Match": etag},
+        verify=False,
+    )
+
+    assert request.status_code == 412
+
+
+def db_queries(endpoint: str) -> float:
+    request = requests.get(METRICS_URL, headers=VALID_HEADERS, verify=False)
+    sample = f'isea_db_queries_sum{{endpoint="{endpoint}",method="POST"}} '
+
+    for line in request.text.splitlines():
+        if line.startswith(sample):
+            return float(line[len(sample) :])
+
+    return 0
+
+
+def test_write_queries():
+    event_id = create_test_event("query count registration")
+    writes = [
+        (
+            "create_user",
+            USERS_URL,
+            {"username": "query count", "password": "test"},
+            2,
+        ),
+        (
+            "create_event",
+            EVENTS_URL,
+            {
+                "description": "query count event",
+                "category": "arts",
+                "location": "bu met",
+                "cost": "free",
+                "start_time": "some date format",
+                "end_time": "some other date",
+                "create_user_id": USER_UUID,
+                "update_time": "now",
+            },
+            1,
+        ),
+        (
+            "event_registration",
+            EVENTS_REGISTRATION_URL,
+            {"event_id": event_id, "user_id": USER_UUID},
+            2,
+        ),
+        (
+            "event_favorite",
+            EVENTS_FAVORITE_URL,
+            {"event_id": event_id, "user_id": USER_UUID},
+            1,
+        ),
+    ]
+
+    for endpoint, url, payload, queries in writes:
+        # Group committed writes are not run by the request
+        if GROUP_COMMIT_MS and endpoint.startswith("event_"):
+            queries = 0
+
+        before = db_queries(endpoint)
+        request = requests.post(url, json=payload, headers=VALID_HEADERS, verify=False)
+
+        assert request.status_code == 200
+        assert "error" not in json.loads(request.text)
+        assert db_queries(endpoint) - before == queries
+
+
+def test_registration_capacity():
+    capacity = 20
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "description": "capacity event",
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+            "capacity": capacity,
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    event_id = json.loads(request.text)["id"]
+    users = [str(uuid.uuid4()) for _ in range(100)]
+
+    def register(user_id: str) -> dict:
+        request = requests.post(
+            EVENTS_REGISTRATION_URL,
+            json={"event_id": event_id, "user_id": user_id},
+            headers=VALID_HEADERS,
+            verify=False,
+        )
+        assert request.status_code == 200
+        return json.loads(request.text)
+
+    def unregister(user_id: str) -> dict:
+        request = requests.post(
+            EVENT_REGISTRATION_REMOVAL_URL.format(event_id, user_id),
+            headers=VALID_HEADERS,
+            verify=False,
+        )
+        assert request.status_code == 200
+        return json.loads(request.text)
+
+    def registrations() -> int:
+        request = requests.get(
+            EVENT_METRICS_URL.format(event_id), headers=VALID_HEADERS, verify=False
+        )
+        return json.loads(request.text)["registrations"]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(register, users))
+
+    seated = [result["user_id"] for result in results if result["waitlisted"] is None]
+    waitlist = sorted(
+        result["waitlisted"] for result in results if result["waitlisted"]
+    )
+
+    assert len(seated) == capacity
+    assert waitlist == list(range(1, len(users) - capacity + 1))
+    assert registrations() == capacity
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(unregister, seated[:10]))
+
+    assert registrations() == capacity
+
+    first = min(results, key=lambda result: result["waitlisted"] or len(users))
+
+    assert register(first["user_id"])["waitlisted"] is None
+
+
+def test_registration_inactive_event():
+    event_id = create_test_event("canceled registration event")
+    requests.delete(
+        EVENTS_URL,
+        json={"event_id": event_id, "requester_id": ADMIN_UUID},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    for missing_id in (event_id, str(uuid.uuid4())):
+        request = requests.post(
+            EVENTS_REGISTRATION_URL,
+            json={"event_id": missing_id, "user_id": USER_UUID},
+            headers=VALID_HEADERS,
+            verify=False,
+        )
+
+        assert request.status_code == 404
+        assert json.loads(request.text) == {"error": "Result Not Found"}
+
+
+def test_user_missing_role():
+    request = requests.post(
+        USERS_URL,
+        json={
+            "username": "missing role",
+            "password": "test",
+            "user_role_id": "missing role",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    user_id = json.loads(request.text)["id"]
+    request = requests.get(
+        USER_ID_URL.format(user_id), headers=VALID_HEADERS, verify=False
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body["role_name"] is None
+
+    request = requests.post(
+        USERS_LOGIN_URL,
+        json={"username": "missing role", "password": "test"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 200
+
+
+def test_create_events_bulk_conflicts():
+    event = {
+        "category": "arts",
+        "location": "bu met",
+        "cost": "free",
+        "start_time": "some date format",
+        "end_time": "some other date",
+        "create_user_id": USER_UUID,
+        "update_time": "now",
+    }
+    bulk_id = str(uuid.uuid4())
+    request = requests.post(
+        EVENTS_BULK_URL,
+        json=[
+            {**event, "id": EVENT_UUID, "description": "bulk existing id"},
+            {**event, "id": bulk_id, "description": "bulk conflict one"},
+            {**event, "id": bulk_id, "description": "bulk conflict two"},
+        ],
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert response_body[0]["error"] == "Event Not Possible To Create"
+    assert response_body[1]["id"] == bulk_id
+    assert response_body[2]["error"] == "Event Not Possible To Create"
+
+
+def test_create_events_bulk_limit():
+    event = {
+        "description": "bulk limit",
+        "category": "arts",
+        "location": "bu met",
+        "cost": "free",
+        "start_time": "some date format",
+        "end_time": "some other date",
+        "create_user_id": USER_UUID,
+        "update_time": "now",
+    }
+    request = requests.post(
+        EVENTS_BULK_URL, json=[event] * 1001, headers=VALID_HEADERS, verify=False
+    )
+
+    assert request.status_code == 400
+    assert json.loads(request.text) == {"error": "Bad Request"}
+
+
+def test_write_with_token():
+    request = requests.post(
+        USERS_LOGIN_URL,
+        json={"username": "test admin", "password": "test"},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+    headers = {**VALID_HEADERS, "Authorization": "Bearer " + response_body["token"]}
+    admin_id = response_body["id"]
+
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "description": "token created event",
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "some date format",
+            "end_time": "some other date",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+        },
+        headers=headers,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+    event_id = response_body["id"]
+
+    assert response_body["create_user_id"] == admin_id
+
+    # The user of the token is used instead of the user_id of the payload
+    request = requests.post(
+        EVENT_ID_URL.format(create_test_event("user event")),
+        json={"user_id": USER_UUID, "location": "token location"},
+        headers=headers,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+    request = requests.post(
+        EVENT_ID_URL.format(event_id),
+        json={"location": "token location"},
+        headers=headers,
+        verify=False,
+    )
+
+    assert request.status_code == 200
+
+    request = requests.post(
+        EVENTS_REGISTRATION_URL,
+        json={"event_id": event_id, "user_id": USER_UUID},
+        headers=headers,
+        verify=False,
+    )
+
+    assert json.loads(request.text)["user_id"] == admin_id
+
+    request = requests.post(
+        EVENT_REGISTRATION_REMOVAL_URL.format(EVENT_UUID, USER_UUID),
+        headers=headers,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+    for url in (EVENTS_FAVORITE_BATCH_URL, EVENTS_REGISTRATION_BATCH_URL):
+        request = requests.post(
+            url, json={"event_ids": [event_id]}, headers=headers, verify=False
+        )
+        response_body = json.loads(request.text)
+
+        assert request.status_code == 200
+        assert response_body[0]["user_id"] == admin_id
+
+    request = requests.post(
+        EVENTS_FAVORITE_BATCH_URL,
+        json={"event_ids": [event_id]},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+
+    assert request.status_code == 400
+
+
+def test_event_changes_archived():
+    request = requests.post(
+        EVENTS_URL,
+        json={
+            "description": "archived change event",
+            "category": "arts",
+            "location": "bu met",
+            "cost": "free",
+            "start_time": "2000-01-01T10:00:00",
+            "end_time": "2000-01-01T12:00:00",
+            "create_user_id": USER_UUID,
+            "update_time": "now",
+        },
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    event_id = json.loads(request.text)["id"]
+    request = requests.get(
+        EVENTS_CHANGES_URL,
+        params={"since": 0, "per_page": 1000},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    cursor = json.loads(request.text)["cursor"]
+
+    # The event was last changed before the cursor of the client
+    archive_table("event", "2001-01-01")
+
+    request = requests.get(
+        EVENTS_CHANGES_URL,
+        params={"since": cursor},
+        headers=VALID_HEADERS,
+        verify=False,
+    )
+    response_body = json.loads(request.text)
+
+    assert request.status_code == 200
+    assert event_id in response_body["deleted"]
+    assert response_body["events"] == []
+    assert response_body["cursor"] > cursor
+
+
+def test_event_stream():
+    with requests.get(
+        EVENTS_STREAM_URL, headers=VALID_HEADERS, verify=False, stream=True, timeout=10
+    ) as stream:
+        frames = stream.iter_lines(decode_unicode=True)
+
+        assert stream.status_code == 200
+        assert stream.headers["Content-Type"].startswith("text/event-stream")
+        assert next(frames) == "retry: 3000"
+
+        event_id = create_test_event("streamed event")
+        messages = (frame for frame in frames if frame.startswith("data: "))
+        message = next(
+            json.loads(frame[len("data: ") :])
+            for frame in messages
+            if json.loads(frame[len("data: ") :])["id"] == event_id
+        )
+
+    assert message == {"type": "event", "action": "created", "id": event_id}
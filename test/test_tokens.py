@@ -0,0 +1,21 @@
+from api.tokens import create_token, read_token
+
+
+def test_read_token():
+    claims = read_token(create_token("user", "role"))
+
+    assert claims["user_id"] == "user"
+    assert claims["role_id"] == "role"
+
+
+def test_read_token_tampered():
+    payload, _, signature = create_token("user", "role").partition(".")
+    other_payload, _, _ = create_token("admin", "role").partition(".")
+
+    assert read_token(f"{other_payload}.{signature}") is None
+    assert read_token(payload) is None
+    assert read_token("") is None
+
+
+def test_read_token_expired():
+    assert read_token(create_token("user", "role", ttl=-1)) is None